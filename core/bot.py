@@ -1,7 +1,6 @@
 import datetime
 import json
 import logging
-import re
 import sys
 import traceback
 from enum import Enum
@@ -11,9 +10,17 @@ import discord
 from discord.ext import commands
 
 from bson.json_util import dumps
+from handlers.cache import TTLCache
+from handlers.helpformatter import clean_prefix, command_signature
 from handlers.insights import Insights
+from handlers.notifications import Notifier
+from handlers.paginator import PaginatorSessions
 from handlers.reminders import ReminderService
-from pymongo import MongoClient
+from handlers.scheduling import Scheduler
+from handlers.timeparse import parse_time
+from handlers.users import UserResolver
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
 from recordclass import recordclass
 
 
@@ -23,54 +30,20 @@ logger = logging.getLogger(__name__)
 
 def _ensure_database(func: callable):
     @wraps(func)
-    def wrapper(self, *args, **kwargs):
+    async def wrapper(self, *args, **kwargs):
         if not self.db_client:
             return None
-        return func(self, *args, **kwargs)
+        return await func(self, *args, **kwargs)
 
     return wrapper
 
 
-def parse_time(time_re: str) -> datetime.datetime:
-    """Parses a human-made relative time into a datetime.datetime object
-    Args:
-        time_re (str): The time the human has given.
-    Returns:
-        One singular datetime.datetime object.
-    Raises:
-        None.
-    """
-    time_re = re.match(
-        r"(?:(?P<weeks>\d+)w)?(?:\s+)?(?:(?P<days>\d+)d)?(?:\s+)?(?:(?P<hours>\d+)h)?(?:\s+)?(?:(?P<minutes>\d+)m)?(?:\s+)?(?:(?P<seconds>\d+)s)?",
-        time_re,
-    )  # noqa: E501
-
-    if not time_re:  # no matches
-        return time_re
-
-    time_re = time_re.groupdict()
-    for k, v in time_re.items():
-        if not time_re[k]:
-            time_re[k] = 0
-
-    for k, v in time_re.items():
-        time_re[k] = int(v)
-
-    time_re = datetime.timedelta(
-        weeks=time_re.get("weeks"),
-        days=time_re.get("days"),
-        hours=time_re.get("hours"),
-        minutes=time_re.get("minutes"),
-        seconds=time_re.get("seconds"),
-    )
-
-    time_re = datetime.datetime.now() + time_re
-
-    return time_re
-
-
 class Mongo:
-    """Simple wrapper around PyMongo."""
+    """Simple asynchronous wrapper around Motor.
+
+    Every method is a coroutine, so database round trips never block
+    the event loop. Documents are addressed by their ``name`` field, or
+    by a full filter document when a dict is passed instead."""
 
     def __init__(self, db_client, collection):
         self.db_client = db_client
@@ -78,44 +51,154 @@ class Mongo:
             getattr(self.db_client, collection) if db_client is not None else None
         )
 
+    @staticmethod
+    def _query(name) -> dict:
+        return name if isinstance(name, dict) else {"name": name}
+
     @_ensure_database
-    def find(self, name, pretty=False):
-        data = self.collection.find_one({"name": name})
+    async def find(self, name, pretty=False, projection=None):
+        data = await self.collection.find_one(self._query(name), projection)
         if pretty:
             return dumps(data, sort_keys=True, indent=2)
         return data
 
     @_ensure_database
-    def find_all(self, pretty=False) -> dict:
-        """This returns all the documents in a given collection."""
-        return self.collection.find({})
+    async def find_all(
+        self, query=None, projection=None, sort=None, skip=0, limit=0
+    ) -> list:
+        """This returns all the documents in a given collection
+        matching the query."""
+        cursor = self.collection.find(
+            query or {}, projection, sort=sort, skip=skip, limit=limit
+        )
+        return await cursor.to_list(length=None)
+
+    @_ensure_database
+    async def aggregate(self, pipeline: list) -> list:
+        return await self.collection.aggregate(pipeline).to_list(length=None)
 
     @_ensure_database
-    def insert(self, name, value):
-        document = {"name": name}
+    async def count(self, query=None) -> int:
+        return await self.collection.count_documents(query or {})
+
+    @_ensure_database
+    async def insert(self, name, value):
+        document = {"name": name} if name is not None else {}
         document.update(value)
-        return self.collection.insert_one(document)
+        return await self.collection.insert_one(document)
 
     @_ensure_database
-    def update(self, name, data):
-        document = self.find(name)
-        document.update(data)
-        document["name"] = name
-        return self.save(document)
+    async def insert_many(self, documents: list):
+        if not documents:
+            return None
+        return await self.collection.insert_many(documents, ordered=False)
 
     @_ensure_database
-    def pop(self, name, key):
-        document = self.find(name)
-        document.pop(key, None)
-        return self.save(document)
+    async def modify(self, name, operations, upsert=False, array_filters=None):
+        """Applies update operators to a single document in place."""
+        return await self.collection.update_one(
+            self._query(name), operations, upsert=upsert, array_filters=array_filters
+        )
 
     @_ensure_database
-    def delete(self, name):
-        return self.collection.delete_one({"name": name})
+    async def find_and_modify(self, name, operations, upsert=False):
+        """Applies update operators and returns the updated document."""
+        return await self.collection.find_one_and_update(
+            self._query(name),
+            operations,
+            upsert=upsert,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def update(self, name, data, upsert=False, array_filters=None):
+        """Sets the given fields, leaving the rest of the document alone."""
+        return await self.modify(name, {"$set": data}, upsert, array_filters)
+
+    async def inc(self, name, data, upsert=False, array_filters=None):
+        return await self.modify(name, {"$inc": data}, upsert, array_filters)
+
+    async def push(self, name, data, upsert=False, array_filters=None):
+        return await self.modify(name, {"$push": data}, upsert, array_filters)
+
+    async def pull(self, name, data, array_filters=None):
+        return await self.modify(name, {"$pull": data}, array_filters=array_filters)
+
+    async def pop(self, name, key):
+        return await self.modify(name, {"$unset": {key: ""}})
 
     @_ensure_database
-    def save(self, doc):
-        return self.collection.save(doc)
+    async def bulk_write(self, requests: list, ordered=True):
+        """Sends many write operations in a single round trip."""
+        if not requests:
+            return None
+        return await self.collection.bulk_write(requests, ordered=ordered)
+
+    @_ensure_database
+    async def delete(self, name):
+        return await self.collection.delete_one(self._query(name))
+
+    @_ensure_database
+    async def delete_all(self, query):
+        return await self.collection.delete_many(query)
+
+    @_ensure_database
+    async def create_index(self, keys, **kwargs):
+        return await self.collection.create_index(keys, **kwargs)
+
+    @_ensure_database
+    async def index_information(self) -> dict:
+        return await self.collection.index_information()
+
+    @_ensure_database
+    async def set_ttl(self, index_name: str, seconds: int):
+        """Changes the expiry of an existing TTL index in place."""
+        return await self.db_client.command(
+            "collMod",
+            self.collection.name,
+            index={"name": index_name, "expireAfterSeconds": seconds},
+        )
+
+
+# Collection -> (keys, options) for every index the bot relies on.
+INDEXES = {
+    "errors": [
+        ([("name", ASCENDING)], {"unique": True}),
+        ([("fingerprint", ASCENDING)], {"unique": True}),
+    ],
+    "guilds": [([("name", ASCENDING)], {})],
+    "ledger": [
+        (
+            [
+                ("guild", ASCENDING),
+                ("project", ASCENDING),
+                ("task", ASCENDING),
+                ("member", ASCENDING),
+            ],
+            {},
+        ),
+        ([("guild", ASCENDING), ("member", ASCENDING), ("time", DESCENDING)], {}),
+    ],
+    "points": [
+        ([("guild", ASCENDING), ("member", ASCENDING)], {"unique": True}),
+        (
+            [("guild", ASCENDING), ("points", DESCENDING), ("member", ASCENDING)],
+            {},
+        ),
+    ],
+    "projects": [([("guild", ASCENDING), ("name", ASCENDING)], {"unique": True})],
+    "schedule": [([("name", ASCENDING)], {"unique": True})],
+    "tasks": [
+        (
+            [("guild", ASCENDING), ("project", ASCENDING), ("name", ASCENDING)],
+            {"unique": True},
+        ),
+        # Only tasks whose due time hasn't been processed, for the sweeper.
+        (
+            [("due_handled", ASCENDING), ("end_timestamp", ASCENDING)],
+            {"partialFilterExpression": {"due_handled": False}},
+        ),
+    ],
+}
 
 
 class Flags(Enum):
@@ -144,20 +227,7 @@ class HelpCommand(commands.HelpCommand):
 
     def get_command_signature(self, ctx, cmd):
         """Method to return a commands name and signature"""
-        self.context = ctx
-        signature = cmd.signature
-        if not signature and not cmd.parent:  # checking if it has
-            # no args and isn't
-            # a subcommand
-            return f"{self.clean_prefix}{cmd.name}"
-        if signature and not cmd.parent:  # checking if it has
-            # args and isn't a subcommand
-            return f"{self.clean_prefix}{cmd.name} {signature}"
-        if not signature and cmd.parent:  # checking if it has no
-            # args and is a subcommand
-            return f"{self.clean_prefix}{cmd.parent} {cmd.name} {signature}"
-        else:  # else assume it has args a signature and is a subcommand
-            return f"{self.clean_prefix}{cmd.parent} {cmd.name} {signature}"
+        return clean_prefix(ctx) + command_signature(cmd)
 
     # this is a custom written method along with all the others below this
     @staticmethod
@@ -193,18 +263,44 @@ class Bot(commands.Bot):
         super().__init__(*args, **kwargs)
         self._last_exception = None
         self.reminders = None
+        self.scheduler = Scheduler(self)
+        self.resolver = UserResolver(self)
+        self.notifier = Notifier(self)
+        self.paginators = PaginatorSessions(self)
         self.db_client = db_client
         self.config = config
         self.helpc = HelpCommand()
+        # Guild ID -> custom prefixes, read on every message.
+        self.prefixes = TTLCache(maxsize=10000, ttl=3600)
         self.logger = logger
         self.flags = Flags
         self.empty_guild = {
-            "projects": [],
             "points": {},
             "prefix": [self.config.prefix],
             "project_category": None,
         }
 
+    def owns_guild(self, guild_id) -> bool:
+        """Whether a guild's shard runs in this process. Work without a
+        guild (DMs) belongs to shard 0."""
+        shard_ids = getattr(self, "shard_ids", None)
+        if not shard_ids:
+            return True
+        shard = (int(guild_id) >> 22) % self.shard_count if guild_id else 0
+        return shard in shard_ids
+
+    def load_extension(self, name):
+        super().load_extension(name)
+        self.dispatch("extensions_changed")
+
+    def unload_extension(self, name):
+        super().unload_extension(name)
+        self.dispatch("extensions_changed")
+
+    def reload_extension(self, name):
+        super().reload_extension(name)
+        self.dispatch("extensions_changed")
+
     def parse_time(self, time_re) -> datetime.datetime:
         return parse_time(time_re)
 
@@ -256,7 +352,7 @@ class Bot(commands.Bot):
             try:
                 raise error
             except Exception:
-                uuid = await Insights(self).log_cmd_error(ctx, log)
+                uuid = await self.insights.log_cmd_error(ctx, log)
                 if ctx.author.id in self.config.owners:
                     await ctx.send(
                         "DEBUG: This command silently errored. " f"ID: {uuid}"
@@ -270,9 +366,31 @@ class Bot(commands.Bot):
             type(error), error, error.__traceback__, file=sys.stderr
         )
 
+    @property
+    def insights(self) -> Insights:
+        """The loaded Insights cog, or a detached one if it isn't loaded."""
+        return self.get_cog("Insights") or Insights(self)
+
     def db(self, collection):
         return Mongo(self.db_client, collection)
 
+    async def ensure_indexes(self) -> None:
+        """Creates any missing indexes. This is a no-op for existing ones."""
+        for collection, indexes in INDEXES.items():
+            for keys, options in indexes:
+                await self.db(collection).create_index(keys, **options)
+        retention = getattr(self.config, "error_retention_days", 30)
+        expire = int(retention * 86400)
+        # Doubles as the index for listing errors by recency.
+        indexes = await self.db("errors").index_information() or {}
+        existing = indexes.get("last_seen_1")
+        if existing is None:
+            await self.db("errors").create_index("last_seen", expireAfterSeconds=expire)
+        elif existing.get("expireAfterSeconds") != expire:
+            # create_index refuses to change options, so retention changes
+            # are applied with collMod.
+            await self.db("errors").set_ttl("last_seen_1", expire)
+
     async def on_ready(self):
         try:
             self.config.contact_channel = await self.fetch_channel(
@@ -284,9 +402,13 @@ class Bot(commands.Bot):
             self.config.contact_channel = None
         game = discord.Game(f"{self.config.prefix}help for help!")
         await self.change_presence(status=discord.Status.idle, activity=game)
-        self.reminders = ReminderService(self)
+        if not self.reminders:
+            self.reminders = ReminderService(self)
+        if self.db_client:
+            await self.ensure_indexes()
         defaults = [
             "handlers.insights",
+            "handlers.shards",
             "ui.developer",
             "ui.general",
             "ui.support",
@@ -296,7 +418,13 @@ class Bot(commands.Bot):
         extensions = (
             defaults
             if self.db_client
-            else ["handlers.insights", "ui.developer", "ui.general", "ui.support"]
+            else [
+                "handlers.insights",
+                "handlers.shards",
+                "ui.developer",
+                "ui.general",
+                "ui.support",
+            ]
         )
         for i in extensions:
             try:
@@ -307,10 +435,15 @@ class Bot(commands.Bot):
                 log = f"Exception in extension {i}\n"
                 log += "".join(traceback.format_exception(type(e), e, e.__traceback__))
                 self._last_exception = log
-                uuid = await Insights(self).log_error(log)
+                uuid = await self.insights.log_error(log)
                 print(f"An error occured while loading extension {i}:", file=sys.stderr)
                 logger.warning(f"Error ID: {uuid}")
                 traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
+        if not self.scheduler.running:
+            # Extensions register their job handlers on load, so this goes last.
+            jobs = await self.scheduler.load()
+            self.scheduler.start()
+            logger.info(f"Loaded {jobs} scheduled jobs.")
         print("Ready.")
 
     async def on_resumed(self):
@@ -319,6 +452,13 @@ class Bot(commands.Bot):
         print("Resumed.")
 
 
+class ShardedBot(Bot, commands.AutoShardedBot):
+    """The bot, running one or more shards in this process.
+
+    Each shard keeps its own gateway connection, so several processes can
+    split a bot by each running a range of `shard_ids`."""
+
+
 # Connects to MongoDB
 
 with open("./config.json", "r", encoding="utf8") as file:
@@ -328,28 +468,32 @@ with open("./config.json", "r", encoding="utf8") as file:
     )
 
 
-db_client = MongoClient(config.uri)[config.db]
+db_client = AsyncIOMotorClient(config.uri)[config.db]
 try:
-    db_client.collection_names()
+    # One blocking ping at startup; every query after this goes through Motor.
+    MongoClient(config.uri)[config.db].list_collection_names()
 except Exception:
     db_client = None
     logger.warning("MongoDB connection failed. There will be no MongoDB support.")
 
 
-def _prefix_callable(bot, msg):
+async def _prefix_callable(bot, msg):
     base = [f"<@!{bot.user.id}> ", f"<@{bot.user.id}> "]
 
     try:
-        db = Mongo(db_client, "guilds")
-        guild_db = db.find(str(msg.guild.id))
         if not msg.guild:
             base.append(config.prefix)
-        elif not guild_db:
-            base.append(config.prefix)
-        elif not guild_db.get("prefix"):
+            return base
+        prefixes = bot.prefixes.get(msg.guild.id)
+        if prefixes is None:
+            db = Mongo(db_client, "guilds")
+            guild_db = await db.find(str(msg.guild.id), projection={"prefix": True})
+            prefixes = (guild_db or {}).get("prefix") or []
+            bot.prefixes.set(msg.guild.id, prefixes)
+        if not prefixes:
             base.append(config.prefix)
         else:
-            base.extend(guild_db.get("prefix"))
+            base.extend(prefixes)
     except Exception:
         # TODO: Call insights exception here.
         base.append(config.prefix)
@@ -357,9 +501,27 @@ def _prefix_callable(bot, msg):
     return base
 
 
-flux = Bot(
+def _shard_options(config) -> dict:
+    """Reads the sharding options from config. Returns None when the bot
+    isn't sharded. A missing shard_count is decided by Discord, and
+    missing shard_ids means every shard runs in this process."""
+    if not getattr(config, "sharded", False):
+        return None
+    options = {}
+    if getattr(config, "shard_count", None):
+        options["shard_count"] = config.shard_count
+    if getattr(config, "shard_ids", None):
+        if "shard_count" not in options:
+            raise ValueError("shard_ids needs shard_count to be set in config.")
+        options["shard_ids"] = list(config.shard_ids)
+    return options
+
+
+shard_options = _shard_options(config)
+flux = (Bot if shard_options is None else ShardedBot)(
     db_client=db_client,
     config=config,
     command_prefix=_prefix_callable,
     help_command=None,
+    **(shard_options or {}),
 )
@@ -1,9 +1,48 @@
+import asyncio
 import itertools
 import inspect
+import re
+import weakref
 from discord.ext.commands.core import GroupMixin, Command
 from discord.ext.commands.errors import CommandError
 from discord.ext.commands.help import Paginator
 
+# Command -> rendered signature. Entries go with their command on reload.
+_signatures = weakref.WeakKeyDictionary()
+
+
+def clean_prefix(ctx) -> str:
+    """The prefix a command was invoked with, with mentions as ``@name``."""
+    user = ctx.guild.me if ctx.guild else ctx.bot.user
+    # Only the mention is rewritten, so a prefix like `f!` is left alone.
+    mention = re.compile(rf"<@!?{user.id}>")
+    return mention.sub("@" + user.display_name.replace("\\", r"\\"), ctx.prefix)
+
+
+def command_signature(cmd) -> str:
+    """Returns a command's qualified name and parameters, without a prefix.
+    These only change when the command is reloaded, so they're memoized."""
+    signature = _signatures.get(cmd)
+    if signature is None:
+        signature = f"{cmd.qualified_name} {cmd.signature}".rstrip()
+        _signatures[cmd] = signature
+    return signature
+
+
+async def filter_runnable(ctx, cmds) -> list:
+    """Returns the commands the context's author can run, running every
+    command's checks concurrently."""
+    cmds = list(cmds)
+
+    async def can_run(cmd):
+        try:
+            return await cmd.can_run(ctx)
+        except CommandError:
+            return False
+
+    results = await asyncio.gather(*(can_run(cmd) for cmd in cmds))
+    return [cmd for cmd, result in zip(cmds, results) if result]
+
 
 class HelpFormatter:
     """The default base implementation that handles formatting of the help
@@ -65,20 +104,11 @@ class HelpFormatter:
         """The cleaned up invoke prefix.
 
         i.e. mentions are ``@name`` instead of ``<@id>``."""
-        user = self.context.bot.user
-        # this breaks if the prefix mention is not the bot itself but I
-        # consider this to be an *incredibly* strange use case. I'd rather go
-        # for this common use case rather than waste performance for the
-        # odd one.
-        clean_prefix = self.context.prefix.replace("!", "")
-        clean_prefix = clean_prefix.replace(user.mention, "@" + user.name)
-        return clean_prefix
+        return clean_prefix(self.context)
 
     def get_command_signature(self):
         """Retrieves the signature portion of the help page."""
-        prefix = self.clean_prefix
-        cmd = self.command
-        return prefix + cmd.signature
+        return self.clean_prefix + command_signature(self.command)
 
     def get_ending_note(self):
         command_name = self.context.invoked_with
@@ -107,16 +137,6 @@ class HelpFormatter:
 
             return True
 
-        async def predicate(tup):
-            if sane_no_suspension_point_predicate(tup) is False:
-                return False
-
-            cmd = tup[1]
-            try:
-                return await cmd.can_run(self.context)
-            except CommandError:
-                return False
-
         iterator = (
             self.command.all_commands.items()
             if not self.is_cog()
@@ -126,13 +146,9 @@ class HelpFormatter:
             return filter(sane_no_suspension_point_predicate, iterator)
 
         # Gotta run every check and verify it
-        ret = []
-        for elem in iterator:
-            valid = await predicate(elem)
-            if valid:
-                ret.append(elem)
-
-        return ret
+        elems = dict(filter(sane_no_suspension_point_predicate, iterator))
+        runnable = set(await filter_runnable(self.context, set(elems.values())))
+        return [(name, cmd) for name, cmd in elems.items() if cmd in runnable]
 
     def _add_subcommands_to_page(self, max_width, commands):
         for name, command in commands:
@@ -1,53 +1,148 @@
+import hashlib
+import logging
+import re
 import string
 import discord
 
-from discord.ext import commands
+from collections import Counter
+from discord.ext import commands, tasks
+from pymongo import DESCENDING, UpdateOne
+from handlers.paginator import CannotPaginate, EmbedPages
+from handlers.sources import KeysetSource
 from typing import Optional
 from datetime import datetime as dt
 from random import SystemRandom as sysrand
 
 
+logger = logging.getLogger(__name__)
+
+
 class Insights(commands.Cog):
-    """This tracks overall bot usage."""
+    """This tracks overall bot usage.
+
+    Command usage counts and command log entries are buffered in memory
+    and written out together every `telemetry_flush_interval` seconds,
+    or as soon as `telemetry_flush_size` log entries are waiting."""
 
     def __init__(self, bot):
         self.bot = bot
+        self._usage = Counter()
+        self._cmd_logs = []
+        self._channels = {}
+        config = bot.config
+        self.flush_size = getattr(config, "telemetry_flush_size", 25)
+        self.flush.change_interval(
+            seconds=getattr(config, "telemetry_flush_interval", 60)
+        )
+
+    def cog_unload(self):
+        # Cancelling runs after_flush, which writes out what's left.
+        self.flush.cancel()
 
     def increment_cmd(self, cmd) -> None:
-        db = self.bot.db("logs")
-        if not db.find(cmd):
-            db.insert(cmd, {"usage": 1})
+        self._usage[cmd] += 1
+
+    async def flush_usage(self) -> None:
+        """Writes the buffered usage counts with one bulk request."""
+        usage, self._usage = self._usage, Counter()
+        requests = [
+            UpdateOne({"name": cmd}, {"$inc": {"usage": count}}, upsert=True)
+            for cmd, count in usage.items()
+        ]
+        try:
+            await self.bot.db("logs").bulk_write(requests, ordered=False)
+        except Exception:
+            # Keep the counts for the next flush. An unordered write may have
+            # applied some of them, which can then be counted twice.
+            self._usage.update(usage)
+            raise
+
+    async def flush_cmd_logs(self) -> None:
+        """Sends the buffered command log entries as few embeds as possible."""
+        entries, self._cmd_logs = self._cmd_logs, []
+        if not entries:
+            return
+        channel = await self.get_cmd_logs()
+        if not channel:
             return
-        usage = db.find(cmd)["usage"]
-        db.update(cmd, {"usage": usage + 1})
+        pages = [[]]
+        size = 0
+        for entry in entries:
+            if size + len(entry) + 1 > 2048:
+                pages.append([])
+                size = 0
+            pages[-1].append(entry)
+            size += len(entry) + 1
+        for page in pages:
+            embed = discord.Embed(
+                title=f"{len(page)} commands were executed.",
+                description="\n".join(page),
+                timestamp=dt.utcnow(),
+            )
+            try:
+                await channel.send(embed=embed)
+            except discord.errors.NotFound:
+                self.forget_channel(channel.id)
+                return
 
-    async def log_error(self, error) -> str:
-        db = self.bot.db("logs")
-        if not db.find("errors"):
-            db.insert("errors", {})
+    async def flush_all(self) -> None:
+        # Each part is tried on its own, so one failing doesn't hold up the
+        # other, and nothing escapes to stop the loop.
+        for flush in (self.flush_usage, self.flush_cmd_logs):
+            try:
+                await flush()
+            except Exception:
+                logger.exception(f"Insights {flush.__name__} failed.")
+
+    @tasks.loop(seconds=60)
+    async def flush(self) -> None:
+        await self.flush_all()
+
+    @flush.before_loop
+    async def before_flush(self) -> None:
+        await self.bot.wait_until_ready()
+
+    @flush.after_loop
+    async def after_flush(self) -> None:
+        await self.flush_all()
+
+    @staticmethod
+    def fingerprint(error: str) -> str:
+        """Hashes a traceback, ignoring memory addresses, so that repeats
+        of the same error share a fingerprint."""
+        normalized = re.sub(r"0x[0-9a-fA-F]+", "0x?", error)
+        return hashlib.sha1(normalized.encode("utf8")).hexdigest()
+
+    async def store_error(self, error: str, cmd=None, ctx=None) -> dict:
+        """Stores an error, or bumps the counter of an identical earlier one.
+        Returns the stored error document."""
         lower = string.ascii_lowercase
         digits = string.digits
         uuid = "".join(sysrand().choice(lower + digits) for _ in range(8))
-        err = {
-            uuid: {
-                "cmd": None,
-                "error": error,
-                "author": None,
-                "channel": None,
-                "guild": None,
-                "time": None,
-            }
+        now = dt.utcnow()
+        last_seen = {
+            "last_seen": now,
+            "author": str(ctx.author.id) if ctx else None,
+            "channel": str(ctx.channel.id) if ctx else None,
+            "guild": str(ctx.guild.id) if ctx and ctx.guild else None,
         }
-        db.update("errors", err)
-        embed = discord.Embed()
-        embed.title = "Non command exception occurred"
-        embed.description = f"```py\n{error}\n```"
-        embed.timestamp = dt.now()  # TODO: confirm that I can pass dt.now()
-        embed.set_author(name=f"Error ID: {uuid}")
+        stored = await self.bot.db("errors").find_and_modify(
+            {"fingerprint": self.fingerprint(error)},
+            {
+                "$inc": {"occurrences": 1},
+                "$set": last_seen,
+                "$setOnInsert": {"name": uuid, "cmd": cmd, "error": error, "time": now},
+            },
+            upsert=True,
+        )
+        return stored or {"name": uuid, "occurrences": 1}
 
+    async def send_error(self, embed) -> None:
         channel = await self.get_err_logs()
         try:
             await channel.send(embed=embed)
+        except discord.errors.NotFound:
+            self.forget_channel(channel.id)
         except discord.errors.HTTPException:
             desc = embed.description
             first = desc[:2044] + "\n```"
@@ -57,27 +152,21 @@ class Insights(commands.Cog):
             embed = discord.Embed(title="Exception continued", description=second)
             await channel.send(embed=embed)
 
+    async def log_error(self, error) -> str:
+        stored = await self.store_error(error)
+        uuid = stored["name"]
+        embed = discord.Embed()
+        embed.title = "Non command exception occurred"
+        embed.description = f"```py\n{error}\n```"
+        embed.timestamp = dt.utcnow()
+        embed.set_author(name=f"Error ID: {uuid} • Seen {stored['occurrences']}x")
+        await self.send_error(embed)
         return uuid
 
     async def log_cmd_error(self, ctx, error) -> str:
         cmd = ctx.command.qualified_name
-        db = self.bot.db("logs")
-        if not db.find("errors"):
-            db.insert("errors", {})
-        lower = string.ascii_lowercase
-        digits = string.digits
-        uuid = "".join(sysrand().choice(lower + digits) for _ in range(8))
-        err = {
-            uuid: {
-                "cmd": cmd,
-                "error": error,
-                "author": str(ctx.author.id),
-                "channel": str(ctx.channel.id),
-                "guild": str(ctx.guild.id),
-                "time": str(ctx.message.created_at),
-            }
-        }
-        db.update("errors", err)
+        stored = await self.store_error(error, cmd, ctx)
+        uuid = stored["name"]
         cid = ctx.channel.id
         aid = ctx.author.id
         embed = discord.Embed()
@@ -85,65 +174,93 @@ class Insights(commands.Cog):
         embed.description = f"```py\n{error}\n```"
         embed.timestamp = ctx.message.created_at
         embed.set_footer(text=f"Author: {aid} • Channel: {cid}")
-        embed.set_author(name=f"Error ID: {uuid}")
+        embed.set_author(name=f"Error ID: {uuid} • Seen {stored['occurrences']}x")
+        await self.send_error(embed)
+        return uuid
 
-        channel = await self.get_err_logs()
-        try:
-            await channel.send(embed=embed)
-        except discord.errors.HTTPException:
-            desc = embed.description
-            first = desc[:2044] + "\n```"
-            second = "```py\n" + desc[2044:]
-            embed.description = first
-            await channel.send(embed=embed)
-            embed = discord.Embed(title="Exception continued", description=second)
-            await channel.send(embed=embed)
+    async def _log_channel(self, key: str) -> Optional[discord.TextChannel]:
+        """Resolves a log channel from config once, preferring the gateway
+        cache over a REST fetch, and remembers it."""
+        channel = self._channels.get(key)
+        if channel:
+            return channel
+        channel_id = getattr(self.bot.config, key)
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            try:
+                channel = await self.bot.fetch_channel(channel_id)
+            except discord.errors.NotFound:
+                return
+        self._channels[key] = channel
+        return channel
 
-        return uuid
+    def forget_channel(self, channel_id: int) -> None:
+        """Drops a cached log channel so it's resolved again on next use."""
+        for key, channel in list(self._channels.items()):
+            if channel.id == channel_id:
+                del self._channels[key]
 
     async def get_server_logs(self) -> Optional[discord.TextChannel]:
-        server_logs = self.bot.config.server_logs
-        try:
-            chan = await self.bot.fetch_channel(server_logs)
-        except discord.errors.NotFound:
-            return
-        return chan
+        return await self._log_channel("server_logs")
 
     async def get_cmd_logs(self) -> Optional[discord.TextChannel]:
-        cmd_logs = self.bot.config.command_logs
-        try:
-            chan = await self.bot.fetch_channel(cmd_logs)
-        except discord.errors.NotFound:
-            return
-        return chan
+        return await self._log_channel("command_logs")
 
     async def get_err_logs(self) -> Optional[discord.TextChannel]:
-        err_logs = self.bot.config.error_logs
-        try:
-            chan = await self.bot.fetch_channel(err_logs)
-        except discord.errors.NotFound:
-            return
-        return chan
+        return await self._log_channel("error_logs")
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel) -> None:
+        self.forget_channel(channel.id)
 
     @commands.command()
     async def error(self, ctx, uuid: str) -> None:
-        db = self.bot.db("logs")
-        if not db.find("errors"):
-            await ctx.send("Doesn't exist.")
-        elif not db.find("errors").get(uuid):
+        error = await self.bot.db("errors").find(uuid)
+        if not error:
             await ctx.send("Doesn't exist.")
         else:
-            error = db.find("errors").get(uuid)
             cmd = error.get("cmd")
             embed = discord.Embed()
             embed.title = f"Exception in command {cmd}"
             embed.description = f"```py\n{error.get('error')}\n```"
-            embed.timestamp = dt.strptime(error.get("time"), "%Y-%m-%d %H:%M:%S.%f")
+            embed.timestamp = error.get("last_seen")
             errchn = error.get("channel")
             errusr = error.get("author")
-            embed.set_footer(text=f"Author: {errusr} • Channel: {errchn}")
+            seen = error.get("occurrences")
+            embed.set_footer(
+                text=f"Author: {errusr} • Channel: {errchn} • Seen {seen}x"
+            )
             await ctx.send(embed=embed)
 
+    @commands.check(lambda ctx: ctx.author.id in ctx.bot.config.owners)
+    @commands.command()
+    async def errors(self, ctx, page: int = 1) -> None:
+        """Lists stored errors, most recently seen first."""
+        source = KeysetSource(
+            self.bot.db("errors"),
+            {},
+            sort=[("last_seen", DESCENDING), ("_id", DESCENDING)],
+            projection={"name": 1, "cmd": 1, "occurrences": 1, "last_seen": 1},
+        )
+        if not await source.count():
+            await ctx.send("No errors are stored.")
+            return
+
+        async def format_page(errors, start):
+            lines = [
+                f"`{e['name']}` {e.get('cmd') or 'Non command'} • {e['occurrences']}x"
+                for e in errors
+            ]
+            return discord.Embed(title="Errors", description="\n".join(lines))
+
+        try:
+            paginator = await EmbedPages.from_source(
+                ctx.bot, message=ctx.message, source=source, formatter=format_page
+            )
+            await paginator.paginate(min(max(page, 1), paginator.maximum_pages))
+        except CannotPaginate as e:
+            await ctx.send(str(e))
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild) -> None:
         embed = discord.Embed(title=f"Added to guild {guild.name}.")
@@ -152,7 +269,10 @@ class Insights(commands.Cog):
             f" • {self.bot.user.name} is in {len(self.bot.guilds)}"
         )
         channel = await self.get_server_logs()
-        msg = await channel.send("-")
+        try:
+            msg = await channel.send("-")
+        except discord.errors.NotFound:
+            return self.forget_channel(channel.id)
         await msg.delete()
         embed.timestamp = msg.created_at
         await channel.send(embed=embed)
@@ -165,7 +285,10 @@ class Insights(commands.Cog):
             f" • {self.bot.user.name} is in {len(self.bot.guilds)}"
         )
         channel = await self.get_server_logs()
-        msg = await channel.send("-")
+        try:
+            msg = await channel.send("-")
+        except discord.errors.NotFound:
+            return self.forget_channel(channel.id)
         await msg.delete()
         embed.timestamp = msg.created_at
         await channel.send(embed=embed)
@@ -175,25 +298,20 @@ class Insights(commands.Cog):
 
     @commands.Cog.listener()
     async def on_command(self, ctx) -> None:
-        embed = discord.Embed(
-            title=f"Command `{ctx.command.qualified_name}` was executed.",
-            timestamp=ctx.message.created_at,
-        )
-        embed.timestamp = ctx.message.created_at
-        embed.add_field(name="Author", value=ctx.author, inline=True)
+        time = ctx.message.created_at.strftime("%H:%M:%S")
+        entry = f"`{time}` `{ctx.command.qualified_name}` by {ctx.author}"
         if ctx.guild:
-            embed.add_field(name="Guild", value=ctx.guild.name, inline=True)
-            embed.add_field(name="Channel", value=ctx.channel.name, inline=True)
-            embed.set_footer(
-                text=f"{ctx.author.id} • {ctx.guild.id} • {ctx.channel.id}"
-            )
+            entry += f" in {ctx.guild.name} #{ctx.channel.name}"
+            entry += f" ({ctx.author.id} • {ctx.guild.id} • {ctx.channel.id})"
         else:
-            embed.add_field(name="Channel", value="DMs", inline=True)
-            embed.set_footer(text=f"{ctx.author.id}")
+            entry += f" in DMs ({ctx.author.id})"
         self.increment_cmd(ctx.command.qualified_name)
-        channel = await self.get_cmd_logs()
-        await channel.send(embed=embed)
+        self._cmd_logs.append(entry)
+        if len(self._cmd_logs) >= self.flush_size:
+            await self.flush_cmd_logs()
 
 
 def setup(bot):
-    bot.add_cog(Insights(bot))
+    cog = Insights(bot)
+    bot.add_cog(cog)
+    cog.flush.start()
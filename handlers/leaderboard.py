@@ -1,48 +1,42 @@
-from disputils import BotEmbedPaginator
 import discord
 
+from handlers.paginator import CannotPaginate, EmbedPages
+
 
 class Leaderboard:
-    """Creates leaderboard embeds from user data for disputils paginator"""
-
-    async def create(self, ctx, users: dict, sort_by: str):
-        msg = await ctx.send("Loading...")
-        to_sort = self.extract(users, sort_by)
-        sorted_users = sorted(to_sort, key=to_sort.get, reverse=True)
-
-        embeds = await self.create_embeds(
-            ctx=ctx,
-            sorted_users=sorted_users,
-            to_sort=to_sort,
-            title="Leaderboard",
-            icon_url=ctx.guild.icon_url,
-            color=ctx.author.color,
-        )
-
-        paginator = BotEmbedPaginator(ctx, embeds)
-        await msg.delete()
-        await paginator.run()
-
-    def extract(self, users: dict, extract_by: str):
-        extracted = {}
-        for user in users:
-            extracted[user] = users[user][extract_by]
-        return extracted
-
-    async def create_embeds(self, ctx, sorted_users, to_sort, title, icon_url, color):
-        embeds = []
-        start = 0
-        end = 10
-        n = 1
-
-        for i in range(round(len(sorted_users) / 10) + 1):
-            embed = discord.Embed(color=color)
-            embed.set_author(name=title, icon_url=icon_url)
-            for user in sorted_users[start:end]:
-                name = str(n) + ". " + str(await ctx.bot.fetch_user(int(user)))
-                embed.add_field(name=name, value=to_sort[user])
-                n += 1
-            embeds.append(embed)
-            start += 10
-            end += 10
-        return embeds
+    """Creates leaderboard embeds from a guild's ranked points, one page
+    at a time. Pages are only fetched and rendered when they're navigated
+    to."""
+
+    per_page = 10
+
+    async def create(self, ctx, source):
+        """Paginates a source of member and points documents."""
+
+        async def format_page(docs, start):
+            return await self.create_embed(
+                ctx=ctx,
+                ranked=[(doc["member"], doc["points"]) for doc in docs],
+                start=start,
+                title="Leaderboard",
+                icon_url=ctx.guild.icon_url,
+                color=ctx.author.color,
+            )
+
+        try:
+            paginator = await EmbedPages.from_source(
+                ctx.bot, message=ctx.message, source=source, formatter=format_page
+            )
+            await paginator.paginate()
+        except CannotPaginate as e:
+            await ctx.send(str(e))
+
+    async def create_embed(self, ctx, ranked, start, title, icon_url, color):
+        """Creates the embed for one page of (user ID, value) pairs."""
+        embed = discord.Embed(color=color)
+        embed.set_author(name=title, icon_url=icon_url)
+        users = await ctx.bot.resolver.fetch_users(user for user, _ in ranked)
+        for n, (user, value) in enumerate(ranked, start):
+            name = str(n) + ". " + str(users.get(int(user), user))
+            embed.add_field(name=name, value=value)
+        return embed
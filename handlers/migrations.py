@@ -0,0 +1,162 @@
+import asyncio
+import re
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne, UpdateMany
+
+from core.bot import flux
+
+
+async def migrate_guild(guild: dict) -> tuple:
+    """Moves a guild's embedded projects and tasks into their own collections.
+    Args:
+        guild (dict): The guild document, as stored in the guilds collection.
+    Returns:
+        The number of projects and tasks that were migrated.
+    Raises:
+        None.
+    """
+    guild_id = guild.get("name")
+    projects = []
+    tasks = []
+    for project in guild.get("projects") or []:
+        name = project.get("name")
+        projects.append(
+            ReplaceOne(
+                {"guild": guild_id, "name": name},
+                {
+                    "name": name,
+                    "guild": guild_id,
+                    "owner": project.get("owner"),
+                    "members": project.get("members") or [],
+                    "channel": project.get("channel"),
+                    "message": project.get("message"),
+                },
+                upsert=True,
+            )
+        )
+        for task in project.get("tasks") or []:
+            task = {k: v for k, v in task.items() if k not in ("_id", "number")}
+            task.update({"guild": guild_id, "project": name})
+            query = {"guild": guild_id, "project": name, "name": task.get("name")}
+            tasks.append(ReplaceOne(query, task, upsert=True))
+
+    # Replacements are keyed on the unique indexes, so re-running is harmless.
+    await flux.db("projects").bulk_write(projects, ordered=False)
+    await flux.db("tasks").bulk_write(tasks, ordered=False)
+    await flux.db("guilds").pop(guild_id, "projects")
+    return len(projects), len(tasks)
+
+
+async def migrate_projects() -> tuple:
+    """Migrates every guild that still embeds its projects.
+    Returns:
+        The number of guilds, projects and tasks that were migrated.
+    """
+    await flux.ensure_indexes()
+    guilds = await flux.db("guilds").find_all({"projects": {"$exists": True}}) or []
+    total_projects = total_tasks = 0
+    for guild in guilds:
+        projects, tasks = await migrate_guild(guild)
+        total_projects += projects
+        total_tasks += tasks
+    await migrate_due_times()
+    return len(guilds), total_projects, total_tasks
+
+
+async def migrate_due_times() -> None:
+    """Prepares tasks from before the overdue sweeper for it, and drops the
+    per-task due timers it replaces. Tasks already past their due time were
+    handled by those timers, so they're marked as handled."""
+    missing = {"due_handled": {"$exists": False}}
+    now = datetime.now(timezone.utc)
+    await flux.db("tasks").bulk_write(
+        [
+            UpdateMany(
+                {**missing, "end_timestamp": {"$lte": now}},
+                {"$set": {"due_handled": True}},
+            ),
+            UpdateMany(missing, {"$set": {"due_handled": False}}),
+        ]
+    )
+    await flux.db("schedule").delete_all({"kind": "task_due"})
+
+
+_POINT_LOG = re.compile(r"point_(addition|removal)_(\d+)_(.+)", re.DOTALL)
+
+
+async def backfill_ledger() -> tuple:
+    """Copies the point changes logged before the ledger existed into it.
+    Those logs name only the member and the task, so each is matched to
+    the task of that name the member is assigned to. Logs that match no
+    task, or more than one, are skipped, as are logs already copied, so
+    re-running is harmless.
+    Returns:
+        The number of logs copied and skipped.
+    """
+    logs = await flux.db("logs").find_all(
+        {"name": {"$regex": "^point_(addition|removal)_"}}
+    )
+    parsed = [(log, _POINT_LOG.fullmatch(log["name"])) for log in logs or []]
+    names = list({match[3] for _, match in parsed if match})
+    tasks = await flux.db("tasks").find_all(
+        {"name": {"$in": names}},
+        projection={
+            "guild": True,
+            "project": True,
+            "name": True,
+            "assigned": True,
+            "value": True,
+        },
+    )
+    owners = {}
+    for task in tasks or []:
+        for member in task.get("assigned") or []:
+            owners.setdefault((str(member), task["name"]), []).append(task)
+
+    # Additions used to log the member's running total rather than the
+    # change, so a member's gains from a task are capped at its value.
+    # Some removals were logged as positive amounts.
+    parsed.sort(key=lambda item: item[0].get("time") or datetime.max)
+    gained = {}
+    entries = []
+    for log, match in parsed:
+        found = owners.get((match[2], match[3]), []) if match else []
+        if len(found) != 1:
+            continue
+        task = found[0]
+        amount = abs(log.get("amount") or 0)
+        if match[1] == "removal":
+            amount = -amount
+        else:
+            key = (task["_id"], match[2])
+            amount = max(min(amount, (task.get("value") or 0) - gained.get(key, 0)), 0)
+            gained[key] = gained.get(key, 0) + amount
+        entries.append(
+            {
+                "guild": task["guild"],
+                "member": match[2],
+                "project": task["project"],
+                "task": task["name"],
+                "amount": amount,
+                "time": log.get("time"),
+                "log": log["_id"],
+            }
+        )
+
+    copied = await flux.db("ledger").find_all(
+        {"log": {"$in": [entry["log"] for entry in entries]}},
+        projection={"log": True},
+    )
+    copied = {entry["log"] for entry in copied or []}
+    entries = [entry for entry in entries if entry["log"] not in copied]
+    await flux.db("ledger").insert_many(entries)
+    return len(entries), len(parsed) - len(entries)
+
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    guilds, projects, tasks = loop.run_until_complete(migrate_projects())
+    print(f"Migrated {projects} projects and {tasks} tasks from {guilds} guilds.")
+    copied, skipped = loop.run_until_complete(backfill_ledger())
+    print(f"Copied {copied} point logs to the ledger, skipped {skipped}.")
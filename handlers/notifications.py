@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Iterable
+
+import discord
+
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier:
+    """Delivers direct messages in the background, retrying rate limited
+    and failed sends."""
+
+    def __init__(self, bot, workers: int = 5, retries: int = 3, backoff=2.0):
+        self.bot = bot
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def notify(self, user_id, content: str) -> None:
+        """Queues a DM to a user."""
+        self.start()
+        self._queue.put_nowait((int(user_id), content))
+
+    def notify_many(self, user_ids: Iterable, content: str) -> None:
+        """Queues the same DM to every given user, once each."""
+        for user_id in dict.fromkeys(int(x) for x in user_ids):
+            self.notify(user_id, content)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            self.bot.loop.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            user_id, content = await self._queue.get()
+            try:
+                await self._deliver(user_id, content)
+            except Exception:
+                logger.exception(f"Notifying {user_id} failed.")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, user_id: int, content: str) -> None:
+        user = await self.bot.resolver.fetch_user(user_id)
+        if not user:
+            return
+        for attempt in range(self.retries + 1):
+            try:
+                await user.send(content)
+                return
+            except discord.errors.Forbidden:
+                # DMs are closed, or we share no guild any more.
+                return
+            except discord.errors.HTTPException as e:
+                if attempt == self.retries or (e.status != 429 and e.status < 500):
+                    raise
+                retry_after = e.response.headers.get("Retry-After")
+                delay = self.backoff * 2**attempt
+                await asyncio.sleep(float(retry_after or delay))
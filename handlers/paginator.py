@@ -1,11 +1,133 @@
 import asyncio
+import heapq
+import logging
+
 import discord
 
+from handlers.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
 
 class CannotPaginate(Exception):
     pass
 
 
+class PaginatorSessions:
+    """Runs every interactive pagination session of the bot, expiring
+    idle ones from a single timer task."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._sessions = {}
+        self._queued = {}
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        bot.add_listener(self.on_raw_reaction_add, "on_raw_reaction_add")
+        bot.add_listener(self.on_raw_reaction_remove, "on_raw_reaction_remove")
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def register(self, pages) -> None:
+        """Starts handing reactions on the pages' message to it."""
+        pages.expires = self.bot.loop.time() + pages.timeout
+        self._sessions[pages.message.id] = pages
+        self.queue(pages)
+        if self._task is None or self._task.done():
+            self._task = self.bot.loop.create_task(self._run())
+
+    def unregister(self, pages) -> None:
+        self._sessions.pop(pages.message.id, None)
+
+    def queue(self, pages) -> None:
+        """Makes sure the timer wakes up for the pages' next deadline."""
+        deadline = pages.deadline()
+        queued = self._queued.get(pages.message.id)
+        if queued is not None and queued <= deadline:
+            return
+        self._queued[pages.message.id] = deadline
+        heapq.heappush(self._heap, (deadline, pages.message.id))
+        if self._heap[0][1] == pages.message.id:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while self._sessions or self._heap:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            deadline, message_id = self._heap[0]
+            delay = deadline - self.bot.loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if self._queued.get(message_id) != deadline:
+                continue  # superseded by an earlier deadline
+            del self._queued[message_id]
+            pages = self._sessions.get(message_id)
+            if pages:
+                self.bot.loop.create_task(self._tick(pages))
+
+    async def _tick(self, pages) -> None:
+        now = self.bot.loop.time()
+        async with pages.lock:
+            try:
+                if pages.expires <= now:
+                    self.unregister(pages)
+                    await pages.expire()
+                elif pages.revert_at is not None and pages.revert_at <= now:
+                    pages.revert_at = None
+                    await pages.show_current_page()
+            except discord.HTTPException:
+                pass
+            if pages.message.id in self._sessions:
+                self.queue(pages)
+
+    async def _handle(self, payload, added: bool) -> None:
+        pages = self._sessions.get(payload.message_id)
+        if pages is None or payload.user_id != pages.author.id:
+            return
+        func = pages.reaction_map.get(str(payload.emoji))
+        if func is None:
+            return
+        can_remove = payload.guild_id is not None and pages.permissions.manage_messages
+        if not added and can_remove:
+            # Either our own removal after a press, or not a press at all.
+            return
+        if added and can_remove:
+            try:
+                member = discord.Object(payload.user_id)
+                await pages.message.remove_reaction(payload.emoji, member)
+            except discord.HTTPException:
+                pass  # can't remove it so don't bother doing so
+        async with pages.lock:
+            pages.expires = self.bot.loop.time() + pages.timeout
+            pages.revert_at = None
+            try:
+                await func()
+            except Exception:
+                logger.exception(f"Paginator action {func.__name__} failed.")
+            if not pages.paginating:
+                self.unregister(pages)
+            else:
+                self.queue(pages)
+
+    async def on_raw_reaction_add(self, payload) -> None:
+        await self._handle(payload, added=True)
+
+    async def on_raw_reaction_remove(self, payload) -> None:
+        # Where reactions can't be removed for the user (DMs, or no
+        # manage messages), taking one back counts as a press too.
+        await self._handle(payload, added=False)
+
+
 class Pages:
     """Implements a paginator that queries the user for the
     pagination interface.
@@ -13,9 +135,12 @@ class Pages:
     Pages are 1-index based, not 0-index based.
 
     If the user does not reply within 2 minutes, the pagination
-    interface exits automatically.
+    interface exits automatically. The session itself is run by
+    `bot.paginators`.
     """
 
+    timeout = 120.0
+
     def __init__(self, bot, *, message, entries, per_page=10):
         self.bot = bot
         self.entries = entries
@@ -47,6 +172,10 @@ class Pages:
             ("\N{BLACK SQUARE FOR STOP}", self.stop_pages),
             ("\N{INFORMATION SOURCE}", self.show_help),
         ]
+        self.reaction_map = dict(self.reaction_emojis)
+        self.lock = asyncio.Lock()
+        self.expires = None
+        self.revert_at = None
 
         server = self.message.guild
         if server is not None:
@@ -97,6 +226,14 @@ class Pages:
         p.append("Confused? React with \N{INFORMATION SOURCE} for more info.")
         self.embed.description = "\n".join(p)
         self.message = await self.message.channel.send(embed=self.embed)
+        await self.start_session()
+
+    async def start_session(self):
+        """Hands the sent message to `bot.paginators` and adds the buttons."""
+        self.bot.paginators.register(self)
+        await self.add_reactions()
+
+    async def add_reactions(self):
         for (reaction, _) in self.reaction_emojis:
             if self.maximum_pages == 2 and reaction in ("\u23ed", "\u23ee"):
                 # no |<< or >>| buttons if we only have two pages
@@ -110,6 +247,19 @@ class Pages:
                 # anything
                 return
 
+    def deadline(self):
+        """When the session next needs attention, in loop time."""
+        if self.revert_at is not None:
+            return min(self.expires, self.revert_at)
+        return self.expires
+
+    async def expire(self):
+        self.paginating = False
+        try:
+            await self.message.clear_reactions()
+        except (discord.errors.Forbidden, discord.NotFound):
+            pass
+
     async def checked_show_page(self, page):
         if page != 0 and page <= self.maximum_pages:
             await self.show_page(page)
@@ -189,71 +339,19 @@ class Pages:
         curn = self.current_page
         e.set_footer(text=f"We were on page {curn} before this message.")
         await self.message.edit(embed=e)
-
-        async def go_back_to_current_page():
-            await asyncio.sleep(60.0)
-            await self.show_current_page()
-
-        self.bot.loop.create_task(go_back_to_current_page())
+        # bot.paginators goes back to the current page after a minute.
+        self.revert_at = self.bot.loop.time() + 60.0
 
     async def stop_pages(self):
         """stops the interactive pagination session"""
         await self.message.delete()
         self.paginating = False
 
-    def react_check(self, reaction, user):
-        if (
-            user is None
-            or user.id != self.author.id
-            or reaction.message.id != self.message.id
-        ):
-            return False
-
-        for (emoji, func) in self.reaction_emojis:
-            if reaction.emoji == emoji:
-                self.match = func
-                return True
-        return False
-
     async def paginate(self, start_page=1):
-        """Actually paginate the entries and run the interactive loop if necessary."""  # noqa: E501
+        """Shows the first page. If there's more than one, the interactive
+        session then runs in the background until stopped or idle."""
         await self.show_page(start_page, first=True)
 
-        while self.paginating:
-            try:
-                reaction_add = self.bot.wait_for(
-                    "reaction_add", check=self.react_check, timeout=120.0
-                )
-                reaction_add = asyncio.ensure_future(reaction_add)
-                reaction_remove = self.bot.wait_for(
-                    "reaction_remove", check=self.react_check, timeout=120.0
-                )
-                reaction_remove = asyncio.ensure_future(reaction_remove)
-                aws = {reaction_add, reaction_remove}
-                constant = "FIRST_COMPLETED"
-                completed, pending = await asyncio.wait(aws, return_when=constant)
-                for first_completed in completed:
-                    react, user = first_completed.result()
-                    break
-                for fut in pending:
-                    if not fut.cancelled():
-                        fut.cancel()
-            except asyncio.TimeoutError:
-                self.paginating = False
-                try:
-                    await self.message.clear_reactions()
-                except discord.errors.Forbidden:
-                    pass
-                finally:
-                    break
-
-            try:
-                await self.message.remove_reaction(react.emoji, user)
-            except discord.errors.Forbidden:
-                pass  # can't remove it so don't bother doing so
-
-            await self.match()
-
 
 class DetailedPages(Pages):
     """A class built on the normal Paginator, except with the idea
@@ -316,15 +414,67 @@ class DetailedPages(Pages):
             self.embed.description += f"React with {info_emoji} for more info."
 
         self.message = await self.message.channel.send(embed=self.embed)
-        for (reaction, _) in self.reaction_emojis:
-            if self.maximum_pages == 2 and reaction in ("\u23ed", "\u23ee"):
-                # no |<< or >>| buttons if we only have two pages
-                # we can't forbid it if someone ends up using it but remove
-                # it from the default set
-                continue
+        await self.start_session()
+
+
+class EmbedPages(Pages):
+    """A paginator where every page is a whole embed, built on demand.
+
+    `builder` is a coroutine function taking a 1-indexed page number and
+    returning its embed. The last few pages built are kept, so paging back
+    and forth doesn't rebuild them."""
+
+    cached_pages = 5
+
+    def __init__(self, bot, *, message, page_count, builder):
+        self.builder = builder
+        self._rendered = TTLCache(maxsize=self.cached_pages, ttl=self.timeout)
+        # A range stands in for the entries, so nothing is materialised.
+        super().__init__(bot, message=message, entries=range(page_count), per_page=1)
+
+    @classmethod
+    async def from_source(cls, bot, *, message, source, formatter):
+        """Paginates a `handlers.sources.QuerySource`. `formatter` is a
+        coroutine function taking a page's entries and the 1-indexed
+        position of its first entry, and returning the page's embed."""
+
+        async def build(page):
+            start = (page - 1) * source.per_page + 1
+            return await formatter(await source.get_page(page), start)
+
+        page_count = await source.page_count()
+        return cls(bot, message=message, page_count=page_count, builder=build)
+
+    async def get_embed(self, page):
+        embed = self._rendered.get(page)
+        if embed is None:
+            embed = await self.builder(page)
+            self._rendered.set(page, embed)
+        return embed
+
+    async def show_page(self, page, *, first=False):
+        self.current_page = page
+        self.embed = await self.get_embed(page)
+        self.embed.set_footer(text=f"Page {page}/{self.maximum_pages}")
+
+        if not self.paginating:
+            return await self.message.channel.send(embed=self.embed)
+
+        if not first:
             try:
-                await self.message.add_reaction(reaction)
+                await self.message.edit(embed=self.embed)
             except discord.NotFound:
-                # If the message isn't found, we don't care about clearing
-                # anything
-                return
+                self.paginating = False
+            return
+
+        # verify we can actually use the pagination session
+        if not self.permissions.add_reactions:
+            raise CannotPaginate("Bot does not have add reactions permission.")
+
+        if not self.permissions.read_message_history:
+            raise CannotPaginate(
+                "Bot does not have Read Message " "History permission."
+            )
+
+        self.message = await self.message.channel.send(embed=self.embed)
+        await self.start_session()
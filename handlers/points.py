@@ -2,63 +2,80 @@ import datetime
 
 
 from core.bot import flux
+from handlers.ranks import Ranks
 
 
 class Points:
-    """Handles giving or talking points."""
+    """Handles giving or talking points.
 
-    def add_points(self, guild_id: int, task: dict, points: int):
-        guild = flux.db("guilds").find(str(guild_id))
-        if not guild.get("points"):
-            guild["points"] = {}
-            flux.db("guilds").update(str(guild_id), guild)
+    Every change is also recorded in the ledger collection, one entry per
+    member, so a task's payouts can be looked up without scanning history."""
 
-        for member in task.get("assigned"):
-            member = str(member)
-            if not guild.get("points").get(member):
-                guild.get("points")[member] = points
-                flux.db("guilds").update(str(guild_id), guild)
-                task_name = task.get("name")
-                flux.db("logs").insert(
-                    f"point_addition_{member}_{task_name}",
-                    {"time": datetime.datetime.now(), "amount": points},
-                )
-            else:
-                current_points = guild.get("points")[member]
-                points = points + current_points
-                guild.get("points")[member] = points
-                flux.db("guilds").update(str(guild_id), guild)
-                task_name = task.get("name")
-                flux.db("logs").insert(
-                    f"point_addition_{member}_{task_name}",
-                    {"time": datetime.datetime.now(), "amount": points},
-                )
+    async def award(self, guild_id: int, deltas: dict, task: dict = None):
+        """Applies many members' point changes at once.
+        Args:
+            guild_id (int): The guild the points belong to.
+            deltas (dict): Member ID -> points to add, negative to remove.
+            task (dict): The task the change is for, if any.
+        Returns:
+            None.
+        Raises:
+            None.
+        """
+        deltas = {str(m): amount for m, amount in deltas.items() if amount}
+        if not deltas:
+            return
+        task = task or {}
+        now = datetime.datetime.utcnow()
+        await flux.db("guilds").inc(
+            str(guild_id),
+            {f"points.{member}": amount for member, amount in deltas.items()},
+            upsert=True,
+        )
+        await flux.db("ledger").insert_many(
+            [
+                {
+                    "guild": str(guild_id),
+                    "member": member,
+                    "project": task.get("project"),
+                    "task": task.get("name"),
+                    "amount": amount,
+                    "time": now,
+                }
+                for member, amount in deltas.items()
+            ]
+        )
+        await Ranks().apply(guild_id, deltas)
 
-    def remove_points(self, guild_id: int, task: dict, points: int):
-        guild = flux.db("guilds").find(str(guild_id))
-        if not guild.get("points"):
-            guild["points"] = {}
-            flux.db("guilds").update(str(guild_id), guild)
+    async def add_points(self, guild_id: int, task: dict, points: int):
+        deltas = {member: points for member in task.get("assigned")}
+        await self.award(guild_id, deltas, task)
 
-        for member in task.get("assigned"):
-            member = str(member)
-            if not guild.get("points").get(member):
-                guild["points"][member] = points
-                flux.db("guilds").update(str(guild_id), guild)
-                task_name = task.get("name")
-                points = points - points - points
-                flux.db("logs").insert(
-                    f"point_removal_{member}_{task_name}",
-                    {"time": datetime.datetime.now(), "amount": points},
-                )
-            else:
-                guild["points"][member] -= points
-                flux.db("guilds").update(str(guild_id), guild)
-                task_name = task.get("name")
-                flux.db("logs").insert(
-                    f"point_removal_{member}_{task_name}",
-                    {"time": datetime.datetime.now(), "amount": points},
-                )
+    async def remove_points(self, guild_id: int, task: dict, points: int):
+        deltas = {member: -points for member in task.get("assigned")}
+        await self.award(guild_id, deltas, task)
+
+    async def revoke(self, guild_id: int, task: dict):
+        """Takes back whatever each assigned member gained from a task."""
+        totals = await self.task_totals(guild_id, task)
+        deltas = {member: -total for member, total in totals.items() if total > 0}
+        await self.award(guild_id, deltas, task)
+
+    async def task_totals(self, guild_id: int, task: dict) -> dict:
+        """Returns the net points each assigned member holds from a task."""
+        pipeline = [
+            {
+                "$match": {
+                    "guild": str(guild_id),
+                    "project": task.get("project"),
+                    "task": task.get("name"),
+                    "member": {"$in": [str(m) for m in task.get("assigned")]},
+                }
+            },
+            {"$group": {"_id": "$member", "total": {"$sum": "$amount"}}},
+        ]
+        totals = await flux.db("ledger").aggregate(pipeline) or []
+        return {row["_id"]: row["total"] for row in totals}
 
     def calculate_points(self, start_timestamp, end_timestamp: float, value: int):
         start = datetime.datetime.fromtimestamp(start_timestamp)
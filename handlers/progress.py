@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+import discord
+
+from handlers.cache import TTLCache
+from handlers.projects import ProjectHandler
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressDisplay:
+    """Keeps the pinned progress bar of every project channel up to date.
+    Changes within `delay` seconds are folded into a single edit."""
+
+    def __init__(self, bot, delay: float = 2.0):
+        self.bot = bot
+        self.delay = delay
+        self._pending = {}
+        self._messages = TTLCache(maxsize=1000, ttl=3600)
+
+    def touch(self, guild_id: int, project: str) -> None:
+        """Marks a project's progress bar as needing an update."""
+        key = (str(guild_id), project)
+        if key not in self._pending:
+            self._pending[key] = self.bot.loop.create_task(self._update(*key))
+
+    def close(self) -> None:
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def _update(self, guild_id: str, project: str) -> None:
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            # Anything from here on starts a new window.
+            self._pending.pop((guild_id, project), None)
+        try:
+            await self.render(guild_id, project)
+        except Exception:
+            logger.exception(f"Updating the progress bar of {project} failed.")
+
+    async def render(self, guild_id: str, project: str) -> None:
+        projects = ProjectHandler(guild_id)
+        project_dict = await projects.find_project(project)
+        if not project_dict:
+            return
+        content = await projects.project_progress_bar(project)
+        message = await self._message(project_dict)
+        if not message or message.content == content:
+            return
+        try:
+            await message.edit(content=content)
+        except discord.errors.NotFound:
+            self._messages.pop(message.id)
+
+    async def _message(self, project: dict):
+        """Returns the pinned message of a project, fetching it only once."""
+        message_id = int(project.get("message"))
+        message = self._messages.get(message_id)
+        if message:
+            return message
+        channel_id = int(project.get("channel"))
+        try:
+            channel = self.bot.get_channel(channel_id)
+            channel = channel or await self.bot.fetch_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+        except discord.errors.NotFound:
+            return
+        self._messages.set(message_id, message)
+        return message
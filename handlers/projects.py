@@ -1,13 +1,63 @@
 import datetime
 
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateOne
+
 from core.bot import flux
+from handlers.scheduling import utc
+
+
+class _Index:
+    """Documents keyed by name. A name mapped to None is a known miss, and
+    once `complete` is set every name not in the index is one too."""
+
+    def __init__(self, complete: bool = False):
+        self._docs = {}
+        self.complete = complete
+
+    def __contains__(self, name: str) -> bool:
+        return self.complete or name in self._docs
+
+    def get(self, name: str) -> dict:
+        return self._docs.get(name)
+
+    def set(self, name: str, doc: dict) -> None:
+        self._docs[name] = doc
+
+    def remove(self, name: str) -> None:
+        self._docs[name] = None
+
+
+async def flush_projects(ctx) -> None:
+    """Sends the writes a command made through `ctx.projects` in one go."""
+    if hasattr(ctx, "projects"):
+        await ctx.projects.flush()
 
 
 class ProjectHandler:
-    """This manages the creation & deletion of projects."""
+    """This manages the creation & deletion of projects.
+
+    Reads are cached for the handler's lifetime, and writes are queued
+    until `flush`."""
 
     def __init__(self, guild: int):
         self.guild = str(guild)
+        self._projects = _Index()
+        self._tasks = {}
+        self._writes = {"projects": [], "tasks": []}
+        self._events = []
+
+    async def flush(self) -> None:
+        """Sends every queued write, then dispatches the queued events."""
+        writes, self._writes = self._writes, {"projects": [], "tasks": []}
+        events, self._events = self._events, []
+        for collection, requests in writes.items():
+            await flux.db(collection).bulk_write(requests)
+        for event, args in events:
+            flux.dispatch(event, *args)
+
+    def _dispatch(self, event: str, *args) -> None:
+        self._events.append((event, args))
 
     def generate_progress_bar(
         self, iter, total, prefix="", suffix="", decimals=1, length=22, fill="\u2588"
@@ -30,207 +80,182 @@ class ProjectHandler:
         progress_bar = "\r%s |%s| %s%% %s" % (prefix, bar, percent, suffix)
         return progress_bar
 
-    def create_project(
+    def _task_index(self, project: str) -> _Index:
+        return self._tasks.setdefault(project, _Index())
+
+    async def create_project(
         self, owner: int, member: int, name: str, channel: int, message: int
     ) -> dict:
         """This creates a project."""
         project = {
+            "_id": ObjectId(),
             "name": name,
-            "tasks": [],
+            "guild": self.guild,
             "owner": str(owner),
             "members": [str(member)],
             "channel": str(channel),
             "message": str(message),
-            "number": None,
         }
-        guild_db = flux.db("guilds").find(self.guild)
-        if not guild_db:
-            project["number"] = 0
-            flux.db("guilds").insert(self.guild, {"projects": [project]})
-        elif not guild_db.get("projects"):
-            project["number"] = 0
-            flux.db("guilds").update(self.guild, {"projects": [project]})
-        else:
-            if self.find_project(name):
-                return None
-            project["number"] = len(guild_db.get("projects"))
-            guild_db.get("projects").append(project)
-            flux.db("guilds").update(self.guild, guild_db)
-
-        flux.dispatch("project_created", name)
+        if await self.find_project(name):
+            return None
+        self._writes["projects"].append(InsertOne(project))
+        self._projects.set(name, project)
+        # A new project has no tasks, so there's nothing to look up.
+        self._tasks[name] = _Index(complete=True)
+
+        self._dispatch("project_created", name)
         return project
 
-    def delete_project(self, name: str) -> None:
+    async def delete_project(self, name: str) -> None:
         """This deletes a project."""
-        project = self.find_project(name)
+        project = await self.find_project(name)
         if not project:
             return
-        guild = flux.db("guilds").find(self.guild)
-
-        for i in range(len(guild.get("projects"))):
-            if guild.get("projects")[i].get("name") == name:
-                del guild["projects"][i]
-                break
-        flux.db("guilds").update(self.guild, guild)
+        self._writes["projects"].append(DeleteOne({"_id": project["_id"]}))
+        self._writes["tasks"].append(DeleteMany({"guild": self.guild, "project": name}))
+        self._projects.remove(name)
+        self._tasks[name] = _Index(complete=True)
 
-    def find_project(self, name: str) -> dict:
+    async def find_project(self, name: str) -> dict:
         """This searches for a project within a given guild."""
-        guild = flux.db("guilds").find(self.guild)
-        if not guild:
-            flux.db("guilds").insert(self.guild, {"projects": []})
-            return
-        projects = guild.get("projects")
-        if not projects:
-            return
-        return next((item for item in projects if item["name"] == name), None)
+        if name not in self._projects:
+            query = {"guild": self.guild, "name": name}
+            self._projects.set(name, await flux.db("projects").find(query))
+        return self._projects.get(name)
 
-    def update_project_channel(self, project: str, channel: int) -> dict:
+    async def update_project_channel(self, project: str, channel: int) -> dict:
         """This updates the channel that contains the information display."""
-        project = self.find_project(project)
+        project = await self.find_project(project)
         project["channel"] = channel
-        flux.db("guilds").update(self.guild, project)
+        self._writes["projects"].append(
+            UpdateOne({"_id": project["_id"]}, {"$set": {"channel": channel}})
+        )
         return project
 
-    def project_completion(self, project: str) -> int:
+    async def _task_counts(self, project: str) -> tuple:
+        """Returns the total and completed task counts of a project,
+        as last flushed."""
+        query = {"guild": self.guild, "project": project}
+        tasks = await flux.db("tasks").count(query)
+        if tasks == 0:
+            return 0, 0
+        query["completed"] = True
+        return tasks, await flux.db("tasks").count(query)
+
+    async def project_completion(self, project: str) -> int:
         """This returns how close a project is to completion, out of 100."""
-        guild = flux.db("guilds").find(self.guild)
-        if not (guild and guild.get("projects")):
+        if not await self.find_project(project):
             return
-        project = next(
-            (item for item in guild.get("projects") if item["name"] == project), None
-        )
-        if not project:
-            return
-        tasks = len(project.get("tasks"))
+        tasks, completed_tasks = await self._task_counts(project)
         if tasks == 0:
             return
-        completed_tasks = len(
-            [item for item in project.get("tasks") if item.get("completed")]
-        )
         if completed_tasks == 0:
             return 0
         return round(completed_tasks / tasks * 100)
 
-    def project_progress_bar(self, project: str) -> int:
+    async def project_progress_bar(self, project: str) -> int:
         """This returns how close a project is to completion, out of 100."""
-        guild = flux.db("guilds").find(self.guild)
-        if not (guild and guild.get("projects")):
+        if not await self.find_project(project):
             return
-        project = next(
-            (item for item in guild.get("projects") if item["name"] == project), None
-        )
-        if not project:
-            return
-        tasks = len(project.get("tasks"))
+        tasks, completed_tasks = await self._task_counts(project)
         if tasks == 0:
             return "Create a task to have a progress bar!"
-        completed_tasks = len(
-            [item for item in project.get("tasks") if item.get("completed")]
-        )
-        # if completed_tasks == 0:
-        #    return
         return self.generate_progress_bar(
             completed_tasks, tasks, prefix="Project Progress:", suffix="Complete"
         )
 
-    def add_project_members(self, project: str, members: list) -> dict:
+    async def add_project_members(self, project: str, members: list) -> dict:
         """This adds a project member to the member list."""
-        guild_db = flux.db("guilds").find(self.guild)
         members = [str(member) for member in members]
-        project = self.find_project(project)
-        current_owners = project.get("members")
-        current_owners.extend(members)
-        guild_db["projects"][project.get("number")]["members"] = current_owners
-        flux.db("guilds").update(self.guild, guild_db)
+        project = await self.find_project(project)
+        project.get("members").extend(members)
+        self._writes["projects"].append(
+            UpdateOne(
+                {"_id": project["_id"]}, {"$push": {"members": {"$each": members}}}
+            )
+        )
 
-        flux.dispatch("project_member_add", self.guild, project, members)
+        self._dispatch("project_member_add", self.guild, project, members)
         return project
 
-    def create_task(
+    async def create_task(
         self, project: str, name: str, value: int, due: datetime.datetime
     ) -> dict:
-        """This creates a task within a project."""
-        start_ = datetime.datetime.now() + datetime.timedelta(minutes=0)
+        """This creates a task within a project.
+        Returns None if a task with that name already exists."""
+        if await self.find_task(project, name):
+            return None
+        start_ = datetime.datetime.now(datetime.timezone.utc)
         task = {
+            "_id": ObjectId(),
             "name": name,
+            "guild": self.guild,
             "start_timestamp": start_,
-            "end_timestamp": due,
+            "end_timestamp": utc(due),
+            "due_handled": False,
             "completed": False,
             "assigned": [],
             "value": value,
             "project": project,
-            "number": None,
         }
-        project = self.find_project(project)
-        project.get("tasks").append(task)
-        guild_db = flux.db("guilds").find(self.guild)
-        number = len(guild_db["projects"][project.get("number")]["tasks"])
-        task["number"] = number
-        guild_db["projects"][project.get("number")]["tasks"].append(task)
-        flux.db("guilds").update(self.guild, guild_db)
-        flux.dispatch("task_create", self.guild, task)
+        self._writes["tasks"].append(InsertOne(task))
+        self._task_index(project).set(name, task)
+        self._dispatch("task_create", self.guild, task)
         return task
 
-    def find_task(self, project: str, task: str) -> dict:
+    async def find_task(self, project: str, task: str) -> dict:
         """This searches for a task within a given project,
         within a given guild."""
-        project = self.find_project(project)
-        task = next(
-            (item for item in project.get("tasks") if item["name"] == task), None
-        )
-        return task
+        index = self._task_index(project)
+        if task not in index:
+            query = {"guild": self.guild, "project": project, "name": task}
+            index.set(task, await flux.db("tasks").find(query))
+        return index.get(task)
 
-    def update_task_members(self, project: str, task: str, member: list) -> dict:
+    def _update_task(self, task: dict, operations: dict) -> None:
+        self._writes["tasks"].append(UpdateOne({"_id": task["_id"]}, operations))
+
+    async def update_task_members(self, project: str, task: str, member: list) -> dict:
         """This assigns a member to a task."""
-        task = self.find_task(project, task)
+        task = await self.find_task(project, task)
         member = [str(x) for x in member]
-        project = self.find_project(task.get("project"))
-        guild_db = flux.db("guilds").find(self.guild)
-        guild_db["projects"][project.get("number")]["tasks"][task.get("number")][
-            "assigned"
-        ].extend(member)
-        flux.db("guilds").update(self.guild, guild_db)
-        flux.dispatch("task_member_update", task, int(self.guild), member)
+        task.get("assigned").extend(member)
+        self._update_task(task, {"$push": {"assigned": {"$each": member}}})
+        self._dispatch("task_member_update", task, int(self.guild), member)
         return task
 
-    def update_task_value(self, project: str, task: str, value: int) -> dict:
+    async def update_task_value(self, project: str, task: str, value: int) -> dict:
         """This modifies the value of a task."""
-        task = self.find_task(project, task)
-        guild_db = flux.db("guilds").find(self.guild)
-        guild_db["projects"][project.get("number")]["tasks"][task.get("number")][
-            "value"
-        ] += value
-        flux.db("guilds").update(self.guild, guild_db)
-
-    def update_task_status(self, project: str, task: str, status: bool) -> dict:
+        task = await self.find_task(project, task)
+        task["value"] += value
+        self._update_task(task, {"$inc": {"value": value}})
+        return task
+
+    async def set_task_value(self, project: str, task: str, value: int) -> dict:
+        """This replaces the value of a task."""
+        task = await self.find_task(project, task)
+        task["value"] = value
+        self._update_task(task, {"$set": {"value": value}})
+        return task
+
+    async def update_task_status(self, project: str, task: str, status: bool) -> dict:
         """This marks a task as completed."""
-        task = self.find_task(project, task)
-        if task.get("completed") == status:
-            return task
+        task = await self.find_task(project, task)
         if not task:
             return
-        project = self.find_project(task.get("project"))
-        if not project:
-            return
-        guild_db = flux.db("guilds").find(self.guild)
-        i = 0
-        for iteration in guild_db["projects"]:
-            i += 1
-            if iteration["name"] == project["name"]:
-                print(iteration)
-                break
-        j = 0
-        for iteration in project["tasks"]:
-            j += 1
-            if iteration["name"] == task["name"]:
-                print(iteration)
-                break
-        print(f"i: {i} j: {j}")
-        guild_db["projects"][i - 1]["tasks"][j - 1]["completed"] = status
-        flux.db("guilds").update(self.guild, guild_db)
+        # Not queued like other writes: the status is only changed if it
+        # differs, so of two concurrent completes just one dispatches.
+        writes, self._writes["tasks"] = self._writes["tasks"], []
+        await flux.db("tasks").bulk_write(writes)
+        changed = await flux.db("tasks").find_and_modify(
+            {"_id": task["_id"], "completed": {"$ne": status}},
+            {"$set": {"completed": status}},
+        )
+        task["completed"] = status
+        if changed is None:
+            return task
         if status is True:
-            flux.dispatch("task_complete", self.guild, task)
+            self._dispatch("task_complete", self.guild, task)
         if status is False:
-            print("Do you even get here?")
-            flux.dispatch("task_revoke", self.guild, task)
+            self._dispatch("task_revoke", self.guild, task)
         return task
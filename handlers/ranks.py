@@ -0,0 +1,82 @@
+from pymongo import ASCENDING, DESCENDING, DeleteMany, ReplaceOne, UpdateOne
+
+from core.bot import flux
+from handlers.sources import KeysetSource
+
+
+class Ranks:
+    """Maintains a ranked view of every guild's points.
+
+    The view is the points collection, one document per guild member,
+    indexed on (guild, points). It's kept in step with the guild document
+    by `Points.award`, so the top k or a single member's rank can be read
+    straight off the index instead of sorting the whole points map."""
+
+    order = [("points", DESCENDING), ("member", ASCENDING)]
+
+    async def apply(self, guild_id: int, deltas: dict) -> None:
+        """Applies member point changes to the view in one request."""
+        requests = [
+            UpdateOne(
+                {"guild": str(guild_id), "member": str(member)},
+                {"$inc": {"points": amount}},
+                upsert=True,
+            )
+            for member, amount in deltas.items()
+        ]
+        await flux.db("points").bulk_write(requests, ordered=False)
+
+    async def ensure(self, guild_id: int) -> None:
+        """Builds the view from the guild document, if it never has been."""
+        # Claiming the rebuild reads the points in the same step, so only one
+        # caller rebuilds, and awards after the claim are applied to the view.
+        guild = await flux.db("guilds").find_and_modify(
+            {"name": str(guild_id), "ranked": {"$ne": True}},
+            {"$set": {"ranked": True}},
+        )
+        if not guild:
+            return
+        try:
+            await self.rebuild(guild_id, guild.get("points") or {})
+        except Exception:
+            await flux.db("guilds").update(str(guild_id), {"ranked": False})
+            raise
+
+    async def rebuild(self, guild_id: int, points: dict) -> None:
+        """Sets a guild's view to the given member -> points map."""
+        requests = [
+            DeleteMany({"guild": str(guild_id), "member": {"$nin": list(points)}})
+        ]
+        requests.extend(
+            ReplaceOne(
+                {"guild": str(guild_id), "member": member},
+                {"guild": str(guild_id), "member": member, "points": amount},
+                upsert=True,
+            )
+            for member, amount in points.items()
+        )
+        await flux.db("points").bulk_write(requests, ordered=False)
+
+    def source(self, guild_id: int, per_page: int = 10) -> KeysetSource:
+        """Returns the guild's ranked points as a page source, highest
+        first. Each page is a list of member and points documents."""
+        return KeysetSource(
+            flux.db("points"),
+            {"guild": str(guild_id)},
+            sort=self.order,
+            projection={"member": True, "points": True},
+            per_page=per_page,
+        )
+
+    async def rank(self, guild_id: int, member: int) -> tuple:
+        """Returns a member's 1-indexed rank and points, or (None, 0).
+        Members on equal points share a rank."""
+        doc = await flux.db("points").find(
+            {"guild": str(guild_id), "member": str(member)}
+        )
+        if not doc:
+            return None, 0
+        above = await flux.db("points").count(
+            {"guild": str(guild_id), "points": {"$gt": doc["points"]}}
+        )
+        return above + 1, doc["points"]
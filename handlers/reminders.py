@@ -1,8 +1,6 @@
 from datetime import datetime
 from uuid import uuid4
 
-from handlers.scheduling import Scheduler
-
 
 class Reminder:
     def __init__(self, id, author_id, message, time):
@@ -29,22 +27,22 @@ class Reminder:
 class ReminderService:
     def __init__(self, bot):
         self.bot = bot
+        bot.scheduler.register("reminder", self._remind)
+
+    async def new_reminder(
+        self, author_id: int, message: str, time: datetime, guild_id: int = None
+    ):
+        reminder = Reminder(str(uuid4()), str(author_id), message, time)
+        payload = {"author_id": reminder.author_id, "message": reminder.message}
+        await self.bot.scheduler.schedule(
+            "reminder", time, payload, id=reminder.id, guild=guild_id
+        )
+        return reminder
+
+    async def cancel_reminder(self, id: str) -> bool:
+        return await self.bot.scheduler.cancel(id)
 
-    async def new_reminder(self, author_id: int, message: str, time: datetime):
-        total_seconds = (datetime.now() - time).seconds
-        reminder = Reminder(str(uuid4()), str(author_id), message, total_seconds)
-        data = reminder.serialize()
-        name = data["id"]
-        data.pop("id")
-        self.bot.db("reminders").insert(name, data)
-        await self._set_reminder(reminder)
-
-    async def _set_reminder(self, reminder):
-        async def remind(bot, reminder):
-            author = await bot.fetch_user(reminder.author_id)
-            text = "You asked me to remind you about: "
-            text += f"```{reminder.message}```"
-            await author.send(text)
-            self.bot.db("reminders").delete(reminder.id)
-
-        Scheduler(reminder.time, remind(self.bot, reminder))
+    async def _remind(self, payload: dict):
+        text = "You asked me to remind you about: "
+        text += f"```{payload['message']}```"
+        self.bot.notifier.notify(payload["author_id"], text)
@@ -1,25 +1,183 @@
 import asyncio
-from datetime import datetime
-from typing import Coroutine
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from uuid import uuid4
 
 
-class Scheduler:
-    """ Schedules a callback function. """
+logger = logging.getLogger(__name__)
+
+
+def utc(time: datetime) -> datetime:
+    """Returns time as an aware UTC datetime.
+    Naive datetimes are assumed to be in the machine's local time."""
+    return time.astimezone(timezone.utc)
 
-    def __init__(self, duration: int, callback: Coroutine):
-        self._duration = duration
-        self._callback = callback
-        self._task = asyncio.ensure_future(self._job())
 
-    async def _job(self):
-        await asyncio.sleep(self._duration)
-        await self._callback
+class Job:
+    """A callback of a given kind, due at an absolute UTC time."""
 
-    def cancel(self):
-        self._task.cancel()
+    __slots__ = ("id", "kind", "time", "payload", "persist", "guild")
+
+    def __init__(self, id, kind, time, payload, persist=True, guild=None):
+        self.id = id
+        self.kind = kind
+        self.time = time
+        self.payload = payload
+        self.persist = persist
+        self.guild = guild
+
+    def serialize(self):
+        return {
+            "kind": self.kind,
+            "time": self.time,
+            "payload": self.payload,
+            "guild": self.guild,
+        }
 
     @classmethod
-    def schedule(cls, end: float, callback: Coroutine):
-        """ Schedules task using timestamp. """
-        duration = datetime.fromtimestamp(end) - datetime.now()
-        return cls(duration.seconds, callback)
+    def from_document(cls, doc):
+        # Mongo hands datetimes back naive, but they're always stored as UTC.
+        time = doc["time"].replace(tzinfo=timezone.utc)
+        payload = doc.get("payload") or {}
+        return cls(doc["name"], doc["kind"], time, payload, guild=doc.get("guild"))
+
+    def __repr__(self):
+        return f"<Job id={self.id} kind={self.kind} time={self.time}>"
+
+
+class Scheduler:
+    """Runs persisted jobs at their due time.
+
+    Every pending job lives in one heap, which a single loop task sleeps
+    on until the earliest job is due. Jobs are stored in the schedule
+    collection so they survive restarts, and are reloaded by `load`.
+    Callbacks are registered per kind with `register`."""
+
+    # Upper bound on a single sleep, so clock changes are picked up.
+    max_sleep = 3600
+
+    def __init__(self, bot, collection: str = "schedule"):
+        self.bot = bot
+        self.collection = collection
+        self._handlers = {}
+        self._jobs = {}
+        self._heap = []
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def register(self, kind: str, handler: Callable) -> None:
+        """Registers the coroutine function that runs jobs of a kind.
+        It's called with the job's payload."""
+        self._handlers[kind] = handler
+
+    def get(self, id: str) -> Optional[Job]:
+        return self._jobs.get(id)
+
+    def _push(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (job.time, job.id))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def schedule(
+        self,
+        kind: str,
+        time: datetime,
+        payload: dict = None,
+        id: str = None,
+        persist: bool = True,
+        guild: int = None,
+    ) -> str:
+        """Schedules a job and returns its ID. `guild` decides which process
+        loads the job after a restart, when shards are split across them."""
+        guild = str(guild) if guild else None
+        job = Job(id or str(uuid4()), kind, utc(time), payload or {}, persist, guild)
+        if persist:
+            await self.bot.db(self.collection).insert(job.id, job.serialize())
+        self._push(job)
+        return job.id
+
+    async def cancel(self, id: str) -> bool:
+        """Cancels a pending job. Returns whether it existed."""
+        job = self._jobs.pop(id, None)
+        if job and job.persist:
+            await self.bot.db(self.collection).delete(id)
+        return job is not None
+
+    async def reschedule(self, id: str, time: datetime) -> bool:
+        """Moves a pending job to a new time. Returns whether it existed."""
+        job = self._jobs.get(id)
+        if not job:
+            return False
+        job.time = utc(time)
+        if job.persist:
+            await self.bot.db(self.collection).update(id, {"time": job.time})
+        # The old heap entry goes stale and is skipped when it surfaces.
+        self._push(job)
+        return True
+
+    async def load(self) -> int:
+        """Loads every persisted job of this process's shards in one query."""
+        docs = await self.bot.db(self.collection).find_all() or []
+        loaded = 0
+        for doc in docs:
+            job = Job.from_document(doc)
+            if not self.bot.owns_guild(job.guild):
+                continue
+            self._jobs[job.id] = job
+            self._heap.append((job.time, job.id))
+            loaded += 1
+        heapq.heapify(self._heap)
+        return loaded
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = self.bot.loop.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            time, id = self._heap[0]
+            job = self._jobs.get(id)
+            if job is None or job.time != time:
+                heapq.heappop(self._heap)
+                continue
+            delay = (time - datetime.now(timezone.utc)).total_seconds()
+            if delay > 0:
+                try:
+                    timeout = min(delay, self.max_sleep)
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            del self._jobs[id]
+            self.bot.loop.create_task(self._fire(job))
+
+    async def _fire(self, job: Job) -> None:
+        handler = self._handlers.get(job.kind)
+        if not handler:
+            # Leave it stored, so it runs again on the next load.
+            logger.warning(f"No handler registered for {job!r}.")
+            return
+        try:
+            await handler(job.payload)
+        except Exception:
+            logger.exception(f"Scheduled job {job!r} failed.")
+        if job.persist:
+            await self.bot.db(self.collection).delete(job.id)
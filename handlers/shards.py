@@ -0,0 +1,86 @@
+from collections import Counter
+
+import discord
+from discord.ext import commands, tasks
+
+
+class Shards(commands.Cog):
+    """This tracks the health of every shard run by this process.
+
+    Gateway dispatches are counted per shard, using the shard their guild
+    maps to (events without a guild are counted under `-`), and rolled
+    into per-minute rates."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._window = Counter()
+        self.events = Counter()
+        self.rates = Counter()
+
+    def cog_unload(self):
+        self.roll.cancel()
+
+    def shard_of(self, guild_id) -> int:
+        return (int(guild_id) >> 22) % (self.bot.shard_count or 1)
+
+    @property
+    def sharded(self) -> bool:
+        return isinstance(self.bot, discord.AutoShardedClient)
+
+    def shard_ids(self) -> list:
+        if self.sharded:
+            return sorted(self.bot.shards)
+        return [self.bot.shard_id or 0]
+
+    def latencies(self) -> dict:
+        """Shard ID -> gateway latency in seconds."""
+        if self.sharded:
+            return dict(self.bot.latencies)
+        return {self.bot.shard_id or 0: self.bot.latency}
+
+    def guild_counts(self) -> Counter:
+        return Counter(guild.shard_id or 0 for guild in self.bot.guilds)
+
+    @tasks.loop(seconds=60)
+    async def roll(self) -> None:
+        self.rates, self._window = self._window, Counter()
+
+    @commands.Cog.listener()
+    async def on_socket_response(self, msg) -> None:
+        if msg.get("op") != 0:
+            return
+        data = msg.get("d")
+        guild_id = data.get("guild_id") if isinstance(data, dict) else None
+        shard = self.shard_of(guild_id) if guild_id else "-"
+        self._window[shard] += 1
+        self.events[shard] += 1
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id) -> None:
+        game = discord.Game(f"{self.bot.config.prefix}help for help!")
+        await self.bot.change_presence(
+            status=discord.Status.idle, activity=game, shard_id=shard_id
+        )
+
+    @commands.check(lambda ctx: ctx.author.id in ctx.bot.config.owners)
+    @commands.command()
+    async def shards(self, ctx) -> None:
+        """Shows the latency, guilds and event rate of every shard."""
+        latencies = self.latencies()
+        guilds = self.guild_counts()
+        embed = discord.Embed(title=f"Shards ({self.bot.shard_count or 1} total)")
+        for shard in self.shard_ids():
+            latency = latencies.get(shard, float("nan")) * 1000
+            embed.add_field(
+                name=f"Shard {shard}",
+                value=f"{latency:.0f}ms • {guilds[shard]} guilds\n"
+                f"{self.rates[shard]} events/min • {self.events[shard]} total",
+            )
+        embed.set_footer(text=f"Events without a guild: {self.rates['-']}/min")
+        await ctx.send(embed=embed)
+
+
+def setup(bot):
+    cog = Shards(bot)
+    bot.add_cog(cog)
+    cog.roll.start()
@@ -0,0 +1,104 @@
+import math
+
+from pymongo import ASCENDING
+
+
+class QuerySource:
+    """The documents matching a query, read one 1-indexed page at a time
+    with skip and limit.
+
+    Each read also fetches the `prefetch` pages after it, and only the
+    pages within `prefetch` of the one being viewed are kept, so memory
+    stays flat however many documents match."""
+
+    def __init__(
+        self, db, query: dict, *, sort, projection=None, per_page=10, prefetch=1
+    ):
+        self.per_page = per_page
+        self.db = db
+        self.query = query
+        self.sort = sort
+        self.projection = projection
+        self.prefetch = prefetch
+        self._count = None
+        self._pages = {}
+
+    async def count(self) -> int:
+        if self._count is None:
+            self._count = await self.db.count(self.query)
+        return self._count
+
+    async def page_count(self) -> int:
+        return max(math.ceil(await self.count() / self.per_page), 1)
+
+    async def get_page(self, page: int) -> list:
+        if page not in self._pages:
+            limit = self.per_page * (1 + self.prefetch)
+            self._store(page, await self._fetch(page, limit) or [])
+        self._trim(page)
+        return self._pages[page]
+
+    async def _fetch(self, page: int, limit: int) -> list:
+        return await self.db.find_all(
+            self.query,
+            projection=self.projection,
+            sort=self.sort,
+            skip=(page - 1) * self.per_page,
+            limit=limit,
+        )
+
+    def _store(self, page: int, docs: list) -> None:
+        chunks = [
+            docs[i : i + self.per_page] for i in range(0, len(docs), self.per_page)
+        ]
+        for offset, chunk in enumerate(chunks or [[]]):
+            self._pages[page + offset] = chunk
+
+    def _trim(self, page: int) -> None:
+        for stale in [p for p in self._pages if abs(p - page) > self.prefetch]:
+            del self._pages[stale]
+
+
+class KeysetSource(QuerySource):
+    """Like `QuerySource`, but a page right after one that's been read is
+    found by seeking past that page's last sort key, so the index is
+    entered at the page instead of skipping every document before it.
+    Other pages fall back to skip. The sort keys taken together must be
+    unique, and the projection must include them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._after = {}
+
+    def _seek(self, last: dict) -> dict:
+        """A filter for the documents sorted after `last`."""
+        clauses = []
+        for i, (key, direction) in enumerate(self.sort):
+            clause = {k: last[k] for k, _ in self.sort[:i]}
+            clause[key] = {"$gt" if direction == ASCENDING else "$lt": last[key]}
+            clauses.append(clause)
+        return {"$or": clauses}
+
+    async def _fetch(self, page: int, limit: int) -> list:
+        last = self._after.get(page)
+        if last is None:
+            return await super()._fetch(page, limit)
+        return await self.db.find_all(
+            {"$and": [self.query, self._seek(last)]},
+            projection=self.projection,
+            sort=self.sort,
+            limit=limit,
+        )
+
+    def _store(self, page: int, docs: list) -> None:
+        super()._store(page, docs)
+        for offset in range(0, len(docs), self.per_page):
+            last = docs[min(offset + self.per_page, len(docs)) - 1]
+            after = page + offset // self.per_page + 1
+            self._after[after] = {key: last[key] for key, _ in self.sort}
+
+    def _trim(self, page: int) -> None:
+        super()._trim(page)
+        reach = self.prefetch + 1
+        for stale in [p for p in self._after if abs(p - page) > reach]:
+            del self._after[stale]
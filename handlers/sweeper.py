@@ -0,0 +1,71 @@
+import logging
+from datetime import datetime, timezone
+
+from discord.ext import tasks
+from pymongo import ASCENDING, UpdateMany
+from pymongo.errors import PyMongoError
+
+
+logger = logging.getLogger(__name__)
+
+
+class OverdueSweeper:
+    """Dispatches `task_due` for tasks whose due time has passed. Tasks
+    are marked `due_handled` once processed, so each is dispatched once."""
+
+    def __init__(self, bot, interval: float = 60, batch: int = 100):
+        self.bot = bot
+        self.batch = batch
+        self.sweep.change_interval(seconds=interval)
+
+    def start(self) -> None:
+        if not self.sweep.is_running():
+            self.sweep.start()
+
+    def stop(self) -> None:
+        self.sweep.cancel()
+
+    async def due_tasks(self, now: datetime) -> list:
+        query = {"due_handled": False, "end_timestamp": {"$lte": now}}
+        if getattr(self.bot, "shard_ids", None):
+            # Other processes sweep the guilds of their own shards.
+            query["guild"] = {"$in": [str(guild.id) for guild in self.bot.guilds]}
+        return await self.bot.db("tasks").find_all(
+            query,
+            sort=[("end_timestamp", ASCENDING)],
+            limit=self.batch,
+        )
+
+    @tasks.loop(seconds=60)
+    async def sweep(self) -> None:
+        # An exception would stop the loop for good, and what's left is
+        # picked up again by the next sweep.
+        try:
+            await self.sweep_due()
+        except PyMongoError:
+            logger.exception("Sweeping overdue tasks failed.")
+
+    async def sweep_due(self) -> None:
+        now = datetime.now(timezone.utc)
+        while True:
+            due = await self.due_tasks(now) or []
+            if not due:
+                return
+            ids = [task["_id"] for task in due]
+            await self.bot.db("tasks").bulk_write(
+                [
+                    UpdateMany(
+                        {"_id": {"$in": ids}, "due_handled": False},
+                        {"$set": {"due_handled": True}},
+                    )
+                ]
+            )
+            for task in due:
+                if not task.get("completed"):
+                    self.bot.dispatch("task_due", int(task["guild"]), task)
+            if len(due) < self.batch:
+                return
+
+    @sweep.before_loop
+    async def before_sweep(self) -> None:
+        await self.bot.wait_until_ready()
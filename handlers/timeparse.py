@@ -0,0 +1,134 @@
+import re
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+_RELATIVE = re.compile(
+    r"\s*(?:(?P<weeks>\d+)\s*w)?\s*(?:(?P<days>\d+)\s*d)?"
+    r"\s*(?:(?P<hours>\d+)\s*h)?\s*(?:(?P<minutes>\d+)\s*m)?"
+    r"\s*(?:(?P<seconds>\d+)\s*s)?\s*"
+)
+_ABSOLUTE = re.compile(
+    r"\s*(?:(?P<date>\d{4}-\d{2}-\d{2}))?(?:\s*[T ]\s*)?"
+    r"(?:(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?"
+    r"\s*(?P<tz>Z|UTC|GMT|[+-]\d{2}:?\d{2}|[A-Za-z_]+/[A-Za-z_/+-]+)?\s*"
+)
+
+
+def _tzinfo(name: Optional[str]):
+    """Returns the tzinfo for a zone name or UTC offset, or None if unknown."""
+    if not name or name in ("Z", "UTC", "GMT"):
+        return timezone.utc
+    if name[0] in "+-":
+        digits = name[1:].replace(":", "")
+        offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+        try:
+            return timezone(-offset if name[0] == "-" else offset)
+        except ValueError:  # Not strictly between -24 and +24 hours.
+            return None
+    if ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=512)
+def _parse(text: str) -> Optional[tuple]:
+    """Parses the now-independent part of a time, so it can be cached.
+    Returns ("relative", timedelta), ("date", datetime, tzinfo),
+    ("time", time, tzinfo) or None."""
+    match = _RELATIVE.fullmatch(text)
+    if match and any(match.groups()):
+        weeks, days, hours, minutes, seconds = (int(x or 0) for x in match.groups())
+        try:
+            delta = timedelta(
+                weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds
+            )
+        except OverflowError:
+            return None
+        return "relative", delta
+
+    match = _ABSOLUTE.fullmatch(text)
+    if not match or not (match["date"] or match["hour"]):
+        return None
+    tz = _tzinfo(match["tz"])
+    if tz is None:
+        return None
+    try:
+        clock = time(int(match["hour"] or 0), int(match["minute"] or 0))
+        clock = clock.replace(second=int(match["second"] or 0))
+        if not match["date"]:
+            return "time", clock, tz
+        date = datetime.strptime(match["date"], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return "date", datetime.combine(date, clock), tz
+
+
+def parse_time(text: str, now: datetime = None) -> Optional[datetime]:
+    """Parses a human-made time into an aware UTC datetime.
+    Args:
+        text (str): Either a relative time, like `1w 2d 3h 4m 5s` (any
+            part can be left out), or an absolute one, like `2021-06-01`,
+            `2021-06-01 18:30` or `18:30`. Absolute times can end with a
+            timezone: `UTC`, an offset like `+02:00`, or an IANA name like
+            `Europe/Berlin`, and default to UTC. A time of day on its own
+            means its next occurrence.
+        now (datetime): What relative times are relative to,
+            defaults to the current time.
+    Returns:
+        One singular datetime.datetime object, or None if text couldn't
+        be parsed, isn't after `now`, or lands outside the range of a
+        datetime.
+    Raises:
+        None.
+    """
+    parsed = _parse(text.strip()) if text else None
+    if not parsed:
+        return None
+    now = now or datetime.now(timezone.utc)
+    try:
+        result = _resolve(parsed, now)
+    except OverflowError:
+        return None
+    # Nothing can be scheduled in the past, and a past due time would make
+    # a task overdue at once.
+    return result if result > now else None
+
+
+def _resolve(parsed: tuple, now: datetime) -> datetime:
+    if parsed[0] == "relative":
+        return now + parsed[1]
+    kind, value, tz = parsed
+    if kind == "date":
+        return value.replace(tzinfo=tz).astimezone(timezone.utc)
+    local = now.astimezone(tz)
+    result = datetime.combine(local.date(), value, tzinfo=tz)
+    if result <= local:
+        result = datetime.combine(local.date() + timedelta(days=1), value, tzinfo=tz)
+    return result.astimezone(timezone.utc)
+
+
+if __name__ == "__main__":
+    # A micro-benchmark: python3 -m handlers.timeparse
+    import timeit
+
+    samples = ["10m", "1w 2d", "1w 2d 3h 4m 5s", "2999-06-01 18:30 +02:00", "18:30"]
+    for sample in samples:
+        runs = 100000
+        cached = timeit.timeit(lambda: parse_time(sample), number=runs)
+        uncached = timeit.timeit(
+            lambda: (_parse.cache_clear(), parse_time(sample)), number=runs
+        )
+        print(
+            f"{sample!r:>28}: {cached / runs * 1e6:.2f} µs cached, "
+            f"{uncached / runs * 1e6:.2f} µs uncached"
+        )
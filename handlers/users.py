@@ -0,0 +1,63 @@
+import asyncio
+from typing import Iterable, Optional
+
+import discord
+
+from handlers.cache import TTLCache
+
+
+class UserResolver:
+    """Resolves user and member IDs to objects for every cog.
+
+    The gateway cache is checked first, then a TTL cache of earlier
+    fetches. Anything still missing is fetched over REST, with at most
+    `concurrency` requests in flight at once."""
+
+    def __init__(self, bot, concurrency: int = 10, maxsize: int = 5000, ttl=600):
+        self.bot = bot
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._members = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_user(self, user_id) -> Optional[discord.User]:
+        user_id = int(user_id)
+        user = self.bot.get_user(user_id) or self._users.get(user_id)
+        if user:
+            return user
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.errors.HTTPException:
+                return None
+        self._users.set(user_id, user)
+        return user
+
+    async def fetch_users(self, user_ids: Iterable) -> dict:
+        """Resolves many users concurrently. Returns an ID -> user dict,
+        leaving out any that couldn't be found."""
+        user_ids = list(dict.fromkeys(int(x) for x in user_ids))
+        users = await asyncio.gather(*(self.fetch_user(x) for x in user_ids))
+        return {k: v for k, v in zip(user_ids, users) if v is not None}
+
+    async def fetch_member(self, guild, member_id) -> Optional[discord.Member]:
+        member_id = int(member_id)
+        key = (guild.id, member_id)
+        member = guild.get_member(member_id) or self._members.get(key)
+        if member:
+            return member
+        async with self._semaphore:
+            try:
+                member = await guild.fetch_member(member_id)
+            except discord.errors.HTTPException:
+                return None
+        self._members.set(key, member)
+        return member
+
+    async def fetch_members(self, guild, member_ids: Iterable) -> dict:
+        """Resolves many members of a guild concurrently. Returns an
+        ID -> member dict, leaving out any that couldn't be found."""
+        member_ids = list(dict.fromkeys(int(x) for x in member_ids))
+        members = await asyncio.gather(
+            *(self.fetch_member(guild, x) for x in member_ids)
+        )
+        return {k: v for k, v in zip(member_ids, members) if v is not None}
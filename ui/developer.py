@@ -1,10 +1,10 @@
 import os
 import io
-import time
 import textwrap
 import traceback
 from contextlib import redirect_stdout
-from handlers.scheduling import Scheduler
+from datetime import datetime, timedelta, timezone
+from handlers.migrations import backfill_ledger, migrate_projects
 
 import git
 import discord
@@ -17,6 +17,7 @@ class Developer(commands.Cog, name="Developer"):
     def __init__(self, bot):
         self.bot = bot
         self._last_result = None
+        bot.scheduler.register("schedule_test", self._schedule_test)
 
     async def cog_check(self, ctx):
         return ctx.author.id in ctx.bot.config.owners
@@ -199,12 +200,27 @@ class Developer(commands.Cog, name="Developer"):
 
     @commands.command()
     async def schedule(self, ctx, duration: int) -> None:
-        async def cb(msg):
-            await ctx.send(f"Schedule expired:\n{msg}")
-
-        Scheduler.schedule(time.time() + duration, cb("Test successful!"))
+        """Tests the scheduler with a job that isn't persisted."""
+        when = datetime.now(timezone.utc) + timedelta(seconds=duration)
+        payload = {"channel": ctx.channel.id, "message": "Test successful!"}
+        await ctx.bot.scheduler.schedule("schedule_test", when, payload, persist=False)
         await ctx.send("Schedule created.")
 
+    async def _schedule_test(self, payload: dict) -> None:
+        channel = self.bot.get_channel(payload["channel"])
+        await channel.send(f"Schedule expired:\n{payload['message']}")
+
+    @commands.command()
+    async def migrate(self, ctx) -> discord.Message:
+        """Moves embedded projects and tasks into their own collections."""
+        guilds, projects, tasks = await migrate_projects()
+        copied, skipped = await backfill_ledger()
+        return await ctx.send(
+            f"Migrated `{projects}` projects and `{tasks}` tasks "
+            f"from `{guilds}` guilds.\n"
+            f"Copied `{copied}` point logs to the ledger, skipped `{skipped}`."
+        )
+
     @commands.command()
     async def user_flags(self, ctx, user_id: int) -> discord.Message:
         """Grabs the badges of a user."""
@@ -7,16 +7,23 @@ from discord.ext import commands
 from discord.ext.commands.core import GroupMixin
 
 import handlers.paginator as paginator
-from handlers.reminders import ReminderService
 from handlers.leaderboard import Leaderboard
-from handlers.helpformatter import HelpFormatter
+from handlers.ranks import Ranks
+from handlers.helpformatter import (
+    HelpFormatter,
+    clean_prefix,
+    command_signature,
+    filter_runnable,
+)
 
 
 class General(commands.Cog, name="General"):
     """This cog contains general commands to assist in the usage of Flux."""
 
+    blacklisted_cogs = ["Developer", "Insights"]
+
     def __init__(self):
-        pass
+        self._help_index = None
 
     def get_all_subcommands(self, command):
         yield command
@@ -30,66 +37,73 @@ class General(commands.Cog, name="General"):
         for cmd in bot.commands:
             yield from self.get_all_subcommands(cmd)
 
+    @staticmethod
+    def has_checks(cmd) -> bool:
+        """Whether a command, one of its parents or its cog has checks."""
+        while cmd:
+            if cmd.checks:
+                return True
+            if cmd.cog and type(cmd.cog).cog_check is not commands.Cog.cog_check:
+                return True
+            cmd = cmd.parent
+        return False
+
+    def help_index(self, bot) -> list:
+        """Returns the help overview, built once per set of loaded extensions.
+        It's a list of (cog title, fields) pairs sorted by title, where each
+        field is a (command, name, description, has_checks) tuple."""
+        if self._help_index is not None:
+            return self._help_index
+        groups = {}
+        for cmd in self.get_all_commands(bot):
+            if cmd.hidden or cmd.cog_name in self.blacklisted_cogs:
+                continue
+            if not cmd.help:
+                # Assume if there's no description for a command,
+                # it's not supposed to be used
+                # I.e. the !command command. It's just a parent
+                continue
+            aliases = f"(or {', '.join(cmd.aliases)})" if cmd.aliases else ""
+            name = f"**{cmd.qualified_name}** {aliases}"
+            description = cmd.help.partition("\n")[0]
+            field = (cmd, name, description, self.has_checks(cmd))
+            groups.setdefault(f"{cmd.cog_name} Commands", []).append(field)
+        self._help_index = sorted(groups.items())
+        return self._help_index
+
+    @commands.Cog.listener()
+    async def on_extensions_changed(self) -> None:
+        self._help_index = None
+
     @commands.command(name="help")
     async def _help(self, ctx, *, command=None):
         """This command right here!"""
-        groups = {}
         entries = []
-        blacklisted_cogs = ["Developer", "Insights"]
-        cprefx = ctx.prefix.replace("!", "")
-        cprefx = cprefx.replace(ctx.bot.user.mention, "@" + ctx.bot.user.name)
+        cprefx = clean_prefix(ctx)
 
         if command is not None:
             command = ctx.bot.get_command(command)
 
         if command is None:
-            for cmd in self.get_all_commands(ctx.bot):
-                try:
-                    can_run = await cmd.can_run(ctx)
-                    if not can_run or not cmd.enabled or cmd.hidden:
+            index = self.help_index(ctx.bot)
+            # The global checks are the same for every command, so they're
+            # run once, and only commands with checks of their own after.
+            if not await ctx.bot.can_run(ctx):
+                index = []
+            checked = [f[0] for _, fields in index for f in fields if f[3]]
+            runnable = set(await filter_runnable(ctx, checked))
+
+            for title, fields in index:
+                entry = {"title": title, "fields": []}
+                for cmd, name, description, has_checks in fields:
+                    if not cmd.enabled or (has_checks and cmd not in runnable):
                         continue
-                    elif cmd.cog_name in blacklisted_cogs:
-                        continue
-                except commands.errors.MissingPermissions:
-                    continue
-                except commands.errors.CheckFailure:
-                    continue
-
-                cog = cmd.cog_name
-                if cog in groups:
-                    groups[cog].append(cmd)
-                else:
-                    groups[cog] = [cmd]
-
-            for cog, cmds in groups.items():
-                entry = {"title": "{} Commands".format(cog), "fields": []}
-
-                for cmd in cmds:
-                    if not cmd.help:
-                        # Assume if there's no description for a command,
-                        # it's not supposed to be used
-                        # I.e. the !command command. It's just a parent
-                        continue
-
-                    alias = "(or "
-                    aliases = cmd.aliases
-                    count = len(aliases)
-                    i = 0
-                    for a in aliases:
-                        i += 1
-                        if count == i:
-                            alias = alias + f"{a})"
-                        else:
-                            alias = alias + f"{a}, "
-                    description = cmd.help.partition("\n")[0]
-                    aliases = alias if len(cmd.aliases) > 0 else ""
-                    name_fmt = f"{cprefx}**{cmd.qualified_name}** {aliases}"
                     entry["fields"].append(
-                        {"name": name_fmt, "value": description, "inline": False}
+                        {"name": cprefx + name, "value": description, "inline": False}
                     )
-                entries.append(entry)
+                if entry["fields"]:
+                    entries.append(entry)
 
-            entries = sorted(entries, key=lambda x: x["title"])
             try:
                 pages = paginator.DetailedPages(
                     ctx.bot, message=ctx.message, entries=entries
@@ -105,7 +119,7 @@ class General(commands.Cog, name="General"):
             colour = int(colour, 16)
 
             pages = await Formatter.format_help_for(ctx, command)
-            cmd = cprefx + command.qualified_name + " " + command.signature
+            cmd = cprefx + command_signature(command)
             if isinstance(command, GroupMixin):
                 if ctx.guild:
                     e = discord.Embed(colour=ctx.author.colour)
@@ -150,7 +164,7 @@ class General(commands.Cog, name="General"):
         """A reminder command.
 
         You can put 2+ words by putting your reminder message in quotes.
-        Example: "reminder words" """
+        Example: "reminder words" 1h or "reminder words" 2021-06-01 18:30 UTC"""
         if not ctx.bot.db_client:
             await ctx.send(
                 "Without the database running, this command"
@@ -164,8 +178,11 @@ class General(commands.Cog, name="General"):
         duration = "".join(duration)
         duration = ctx.bot.parse_time(duration)
         if not duration:
-            raise commands.BadArgument("Time could not be parsed.")
-        await ReminderService(ctx.bot).new_reminder(ctx.author.id, to_remind, duration)
+            raise commands.BadArgument("Time could not be parsed, or is in the past.")
+        guild_id = ctx.guild.id if ctx.guild else None
+        await ctx.bot.reminders.new_reminder(
+            ctx.author.id, to_remind, duration, guild_id
+        )
 
         return await ctx.send("Reminder set!")
 
@@ -182,10 +199,11 @@ class General(commands.Cog, name="General"):
             return
         if not user:
             user = ctx.author
-        if not ctx.bot.db("guilds").find(str(ctx.guild.id)):
+        guild_db = await ctx.bot.db("guilds").find(str(ctx.guild.id))
+        if not guild_db:
             await ctx.send("No one has any points.")
             return
-        points = ctx.bot.db("guilds").find(str(ctx.guild.id)).get("points")
+        points = guild_db.get("points")
 
         if not points:
             await ctx.send("No one has any points.")
@@ -213,21 +231,34 @@ class General(commands.Cog, name="General"):
                 " `ERR_CONN_FAILURE`"
             )
             return
-        leaderboardhandler = Leaderboard()
-        if not ctx.bot.db("guilds").find(str(ctx.guild.id)):
+        ranks = Ranks()
+        await ranks.ensure(ctx.guild.id)
+        source = ranks.source(ctx.guild.id, per_page=Leaderboard.per_page)
+        if not await source.count():
             await ctx.send("No one has any points.")
             return
-        points = ctx.bot.db("guilds").find(str(ctx.guild.id)).get("points")
-        if not points:
-            ctx.bot.db("guilds").update(str(ctx.guild.id), {"points": {}})
-            await ctx.send("No one has any points.")
+        await Leaderboard().create(ctx, source)
+
+    @commands.command()
+    async def rank(self, ctx, user: discord.Member = None) -> None:
+        """Check where you or someone else sits on the leaderboard."""
+        if not ctx.bot.db_client:
+            await ctx.send(
+                "Without the database running, this command"
+                " is defunct. "
+                "Please use `.contact` with error:"
+                " `ERR_CONN_FAILURE`"
+            )
             return
-        users = {}
-        for k, v in points.items():
-            users[k] = {"points": v}
-        if users == {}:
-            return await ctx.send("No one has any points.  o.o")
-        await leaderboardhandler.create(ctx, users, sort_by="points")
+        user = user or ctx.author
+        ranks = Ranks()
+        await ranks.ensure(ctx.guild.id)
+        rank, points = await ranks.rank(ctx.guild.id, user.id)
+        who = "You're" if user == ctx.author else f"`{user}` is"
+        if rank is None:
+            await ctx.send(f"{who} not on the leaderboard yet.")
+            return
+        await ctx.send(f"{who} ranked **#{rank}** with `{points}` points.")
 
     @commands.group(invoke_without_subcommand=True)
     async def prefix(self, ctx, *, prefix: typing.Optional[str] = None) -> None:
@@ -254,14 +285,15 @@ class General(commands.Cog, name="General"):
             return
         embed = discord.Embed(color=ctx.author.color)
         embed.set_footer(text="You can also mention the bot as a prefix anywhere.")
-        if not ctx.bot.db("guilds").find(str(ctx.guild.id)):
+        guild_db = await ctx.bot.db("guilds").find(str(ctx.guild.id))
+        if not guild_db:
             text = f"{ctx.bot.user.name}'s "
             text = text + f"prefix is `{ctx.bot.config.prefix}`"
             embed.description = text
 
             await ctx.send(embed=embed)
             return
-        prefixes = ctx.bot.db("guilds").find(str(ctx.guild.id)).get("prefix")
+        prefixes = guild_db.get("prefix")
         if not prefixes:
             prefixes = [ctx.bot.config.prefix]
         _len = len(prefixes)
@@ -300,15 +332,13 @@ class General(commands.Cog, name="General"):
             return
         if not ctx.guild:
             return
-        guild_db = ctx.bot.db("guilds").find(str(ctx.guild.id))
+        guild_db = await ctx.bot.db("guilds").find(str(ctx.guild.id))
         if not guild_db:
-            ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
-            guild_db = ctx.bot.db("guilds").find(str(ctx.guild.id))
-        if not guild_db.get("prefix"):
-            guild_db["prefix"] = []
-            ctx.bot.db("guilds").update(str(ctx.guild.id), guild_db)
-        guild_db["prefix"].extend(prefix.split(" "))
-        ctx.bot.db("guilds").update(str(ctx.guild.id), guild_db)
+            await ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
+        await ctx.bot.db("guilds").push(
+            str(ctx.guild.id), {"prefix": {"$each": prefix.split(" ")}}
+        )
+        ctx.bot.prefixes.pop(ctx.guild.id)
         await ctx.send("Alright! Your prefix settings have been updated.")
 
     @commands.has_permissions(manage_messages=True)
@@ -319,15 +349,19 @@ class General(commands.Cog, name="General"):
         You must have manage messages to use this command."""
         if not ctx.guild:
             return
-        guild_db = ctx.bot.db("guilds").find(str(ctx.guild.id))
+        guild_db = await ctx.bot.db("guilds").find(
+            str(ctx.guild.id), projection={"prefix": True}
+        )
         if not guild_db:
-            ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
-            guild_db = ctx.bot.db("guilds").find(str(ctx.guild.id))
-        if not guild_db.get("prefix"):
-            guild_db["prefix"] = [ctx.bot.config.prefix]
-            ctx.bot.db("guilds").update(str(ctx.guild.id), guild_db)
-        [guild_db["prefix"].remove(x) for x in prefix.split(" ")]
-        ctx.bot.db("guilds").update(str(ctx.guild.id), guild_db)
+            await ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
+        elif not guild_db.get("prefix"):
+            await ctx.bot.db("guilds").update(
+                str(ctx.guild.id), {"prefix": [ctx.bot.config.prefix]}
+            )
+        await ctx.bot.db("guilds").pull(
+            str(ctx.guild.id), {"prefix": {"$in": prefix.split(" ")}}
+        )
+        ctx.bot.prefixes.pop(ctx.guild.id)
         await ctx.send("Alright! Your prefix settings have been updated.")
 
     @commands.command()
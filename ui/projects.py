@@ -2,7 +2,7 @@ import discord
 
 from discord.ext import commands
 
-from handlers.projects import ProjectHandler
+from handlers.projects import ProjectHandler, flush_projects
 
 
 class Projects(commands.Cog, name="Projects"):
@@ -13,6 +13,9 @@ class Projects(commands.Cog, name="Projects"):
         e = "Project Progress: |----------------------| 0.0% Complete"
         self.empty_progress_bar = e
 
+    async def cog_after_invoke(self, ctx) -> None:
+        await flush_projects(ctx)
+
     @commands.group(hidden=True)
     async def projects(self, ctx) -> None:
         """Project related commands."""
@@ -25,8 +28,8 @@ class Projects(commands.Cog, name="Projects"):
     ) -> discord.Message:
         """This creates a project.
         owner allows you to set an owner, default is you."""
-        if ctx.projects.find_project(name):
-            project = ctx.projects.find_project(name)
+        project = await ctx.projects.find_project(name)
+        if project:
             if ctx.guild.get_Channel(int(project.get("channel"))):
                 return await ctx.send("A project with that name exists.")
             else:
@@ -35,14 +38,16 @@ class Projects(commands.Cog, name="Projects"):
                     " project channel was not found. "
                     "I will be overwriting the previous project."
                 )
-                ctx.projects.delete_project(name)
+                await ctx.projects.delete_project(name)
 
         owner = owner if owner else ctx.author
-        if not ctx.bot.db("guilds").find(str(ctx.guild.id)):
-            ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
+        guild_db = await ctx.bot.db("guilds").find(str(ctx.guild.id))
+        if not guild_db:
+            await ctx.bot.db("guilds").insert(str(ctx.guild.id), ctx.bot.empty_guild)
+            guild_db = ctx.bot.empty_guild
 
         # await ctx.send("Creating project channel...")
-        if not ctx.bot.db("guilds").find(str(ctx.guild.id)).get("project_category"):
+        if not guild_db.get("project_category"):
             overwrites = {
                 ctx.guild.default_role: discord.PermissionOverwrite(
                     read_messages=False
@@ -54,16 +59,12 @@ class Projects(commands.Cog, name="Projects"):
             category = await ctx.guild.create_category(
                 "Flux Projects", overwrites=overwrites
             )
-            ctx.bot.db("guilds").update(
+            await ctx.bot.db("guilds").update(
                 str(ctx.guild.id), {"project_category": str(category.id)}
             )
 
         else:
-            category = ctx.guild.get_channel(
-                int(
-                    ctx.bot.db("guilds").find(str(ctx.guild.id)).get("project_category")
-                )
-            )
+            category = ctx.guild.get_channel(int(guild_db.get("project_category")))
 
         overwrites = {
             owner: discord.PermissionOverwrite(
@@ -79,7 +80,7 @@ class Projects(commands.Cog, name="Projects"):
         await channel.send(f"Project Owner: {owner}")
         message = await channel.send(self.empty_progress_bar)
         await message.pin()
-        res = ctx.projects.create_project(
+        res = await ctx.projects.create_project(
             owner.id, owner.id, name, channel.id, message.id
         )
         if not res:
@@ -92,7 +93,8 @@ class Projects(commands.Cog, name="Projects"):
     @projects.command()
     async def delete(self, ctx, project_name: str) -> None:
         """This deletes a project."""
-        if not ctx.projects.find_project(project_name):
+        project = await ctx.projects.find_project(project_name)
+        if not project:
             channel = discord.utils.get(
                 ctx.guild.channels, name=f"{project_name}-project"
             )
@@ -136,7 +138,7 @@ class Projects(commands.Cog, name="Projects"):
                 await ctx.send("I could not find this project.")
                 return
 
-        if str(ctx.author.id) != ctx.projects.find_project(project_name).get("owner"):
+        if str(ctx.author.id) != project.get("owner"):
             await ctx.send("Only the project owner " "can delete this project.")
             return
         message = await ctx.send(
@@ -155,9 +157,9 @@ class Projects(commands.Cog, name="Projects"):
             and (reaction.message.channel == ctx.channel),
         )
         if reaction.emoji.id == ctx.bot.config.tick_yes:
-            channel = ctx.projects.find_project(project_name).get("channel")
+            channel = project.get("channel")
             channel = discord.utils.get(ctx.guild.channels, id=int(channel))
-            ctx.projects.delete_project(project_name)
+            await ctx.projects.delete_project(project_name)
             if channel:
                 await channel.delete(reason="Project deleted.")
             await ctx.send("The project has been deleted.")
@@ -167,10 +169,10 @@ class Projects(commands.Cog, name="Projects"):
     @projects.command()
     async def status(self, ctx, project_name: str) -> discord.Message:
         """This returns the status of a project."""
-        if not ctx.projects.find_project(project_name):
+        if not await ctx.projects.find_project(project_name):
             await ctx.send("This project doesn't exist.")
             return
-        progress_bar = ctx.projects.project_progress_bar(project_name)
+        progress_bar = await ctx.projects.project_progress_bar(project_name)
         if not progress_bar:
             progress_bar = self.empty_progress_bar
         await ctx.send(progress_bar)
@@ -182,22 +184,21 @@ class Projects(commands.Cog, name="Projects"):
         """This adds as many project members as you want to your project.
         This command is limited to the project owner only."""
         project = project_name
-        if not ctx.projects.find_project(project_name):
+        project_dict = await ctx.projects.find_project(project_name)
+        if not project_dict:
             await ctx.send("This project doesn't exist.")
             return
-        if str(ctx.author.id) != ctx.projects.find_project(project).get("owner"):
+        if str(ctx.author.id) != project_dict.get("owner"):
             await ctx.send("You can't add members to this project.")
             return
         members = members if len(members) > 0 else [ctx.author]
         count = len(members)
-        channel = ctx.guild.get_channel(
-            int(ctx.projects.find_project(project).get("channel"))
-        )
+        channel = ctx.guild.get_channel(int(project_dict.get("channel")))
         for member in members:
             await channel.set_permissions(
                 member, read_messages=True, send_messages=False
             )
-        ctx.projects.add_project_members(project, [x.id for x in members])
+        await ctx.projects.add_project_members(project, [x.id for x in members])
         if members == ctx.author:
             await ctx.send("You're already a member.")
         if count == 1:
@@ -219,10 +220,14 @@ class Projects(commands.Cog, name="Projects"):
     ) -> discord.Message:
         """This fires when members are added."""
         # print(project)
-        guild = await self.bot.fetch_guild(guild_id)
+        guild = self.bot.get_guild(int(guild_id))
+        guild = guild or await self.bot.fetch_guild(guild_id)
         channel = await self.bot.fetch_channel(int(project.get("channel")))
-        members = [(await guild.fetch_member(member)) for member in members]
+        members = await self.bot.resolver.fetch_members(guild, members)
+        members = list(members.values())
         count = len(members)
+        if count == 0:
+            return
         if count == 1:
             member = members[0]
             return await channel.send(
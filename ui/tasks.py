@@ -1,12 +1,13 @@
-import datetime
-
 import discord
 
 from discord.ext import commands
 
-from handlers.projects import ProjectHandler
+from handlers.paginator import CannotPaginate, EmbedPages
+from handlers.projects import ProjectHandler, flush_projects
 from handlers.points import Points
-from handlers.scheduling import Scheduler
+from handlers.progress import ProgressDisplay
+from handlers.sources import KeysetSource
+from handlers.sweeper import OverdueSweeper
 
 
 class Tasks(commands.Cog, name="Tasks"):
@@ -14,6 +15,16 @@ class Tasks(commands.Cog, name="Tasks"):
 
     def __init__(self, bot):
         self.bot = bot
+        self.progress = ProgressDisplay(bot)
+        self.sweeper = OverdueSweeper(bot)
+        self.sweeper.start()
+
+    def cog_unload(self) -> None:
+        self.progress.close()
+        self.sweeper.stop()
+
+    async def cog_after_invoke(self, ctx) -> None:
+        await flush_projects(ctx)
 
     @commands.group(hidden=True)
     async def tasks(self, ctx) -> None:
@@ -34,26 +45,25 @@ class Tasks(commands.Cog, name="Tasks"):
         This command is limited to the owner of the provided project.
 
         To set something as due, you can put s for seconds, m for minutes,
-        h for hours, and w for weeks! These are mandatory. E.g 10 minutes or 1w."""
+        h for hours, and w for weeks! These are mandatory. E.g 10 minutes or 1w.
+        You can also give a date and time, e.g 2021-06-01 18:30 UTC."""
         reward = points_gained_when_completed  # Helpful params!
         due = "".join(due)
         due = ctx.bot.parse_time(due)
         if not due:
-            raise commands.BadArgument("Time could not be parsed.")
-        if not ctx.projects.find_project(project):
+            raise commands.BadArgument("Time could not be parsed, or is in the past.")
+        project_dict = await ctx.projects.find_project(project)
+        if not project_dict:
             await ctx.send("That project could not be found.")
             return
-        if str(ctx.author.id) not in ctx.projects.find_project(project).get("owner"):
+        if str(ctx.author.id) not in project_dict.get("owner"):
             await ctx.send("You can't create tasks on this project.")
             return
-        task = ctx.projects.create_task(project, name, reward, due)
-        total_seconds = (datetime.datetime.now() - due).seconds
-
-        async def _call_event():
-            return ctx.bot.dispatch("task_due", ctx.guild.id, task)
-
-        Scheduler(total_seconds, _call_event())
-        ctx.projects.update_task_members(
+        task = await ctx.projects.create_task(project, name, reward, due)
+        if not task:
+            await ctx.send("A task with that name already exists in this project.")
+            return
+        await ctx.projects.update_task_members(
             project, task.get("name"), [str(ctx.author.id)]
         )
         await ctx.send("Task created!")
@@ -65,19 +75,20 @@ class Tasks(commands.Cog, name="Tasks"):
     ) -> None:
         """This assigns members to a project.
         This command is limited to the owner of the provided project."""
-        if not ctx.projects.find_project(project):
+        project_dict = await ctx.projects.find_project(project)
+        if not project_dict:
             await ctx.send("I couldn't find this project.")
             return
-        if str(ctx.author.id) not in ctx.projects.find_project(project).get("owner"):
+        if str(ctx.author.id) not in project_dict.get("owner"):
             await ctx.send("You can't assign members to this task.")
             return
-        task_dict = ctx.projects.find_task(project, task)
+        task_dict = await ctx.projects.find_task(project, task)
         if not task_dict:
             await ctx.end("This task does not exist.")
             return
         members = members if len(members) > 0 else [ctx.author]
         count = len(members)
-        ctx.projects.update_task_members(project, task, [x.id for x in members])
+        await ctx.projects.update_task_members(project, task, [x.id for x in members])
         if members == ctx.author:
             await ctx.send(f"Successfully assigned you to `{task}`.")
             return
@@ -106,14 +117,15 @@ class Tasks(commands.Cog, name="Tasks"):
         This command is limited to the owner of the provided project,
         and the members assigned to the provided task."""
 
-        task = ctx.projects.find_task(project, task)
+        task = await ctx.projects.find_task(project, task)
         if not task:
             await ctx.send("This task does not exist.")
             return
 
-        if str(ctx.author.id) not in ctx.projects.find_project(project).get(
-            "owner"
-        ) and str(ctx.author.id) not in task.get("assigned"):
+        owner = (await ctx.projects.find_project(project)).get("owner")
+        if str(ctx.author.id) not in owner and str(ctx.author.id) not in task.get(
+            "assigned"
+        ):
             await ctx.send(
                 "You weren't assigned to this task."
                 " Request the project owner to assign"
@@ -121,7 +133,7 @@ class Tasks(commands.Cog, name="Tasks"):
             )
             return
 
-        task = ctx.projects.update_task_status(project, task.get("name"), True)
+        task = await ctx.projects.update_task_status(project, task.get("name"), True)
         name = task.get("name")
         await ctx.send(f"Task `{name}` is now completed!")
         return
@@ -132,14 +144,15 @@ class Tasks(commands.Cog, name="Tasks"):
 
         This command is limited to the owner of the provided project,
         and the members assigned to the provided task."""
-        task = ctx.projects.find_task(project, task)
+        task = await ctx.projects.find_task(project, task)
         if not task:
             await ctx.send("This task does not exist.")
             return
 
-        if str(ctx.author.id) not in ctx.projects.find_project(project).get(
-            "owner"
-        ) and str(ctx.author.id) not in task.get("assigned"):
+        owner = (await ctx.projects.find_project(project)).get("owner")
+        if str(ctx.author.id) not in owner and str(ctx.author.id) not in task.get(
+            "assigned"
+        ):
             await ctx.send(
                 "You weren't assigned to this task."
                 " Request the project owner to assign"
@@ -147,23 +160,64 @@ class Tasks(commands.Cog, name="Tasks"):
             )
             return
 
-        task = ctx.projects.update_task_status(project, task.get("name"), False)
+        task = await ctx.projects.update_task_status(project, task.get("name"), False)
         name = task.get("name")
         await ctx.send(f"Task `{name}` is pending again. Bounty restored.")
 
         return
 
+    @tasks.command(name="list")
+    async def list_(self, ctx, project: str) -> None:
+        """This lists the tasks in a project."""
+        if not await ctx.projects.find_project(project):
+            await ctx.send("That project could not be found.")
+            return
+        source = KeysetSource(
+            ctx.bot.db("tasks"),
+            {"guild": ctx.projects.guild, "project": project},
+            sort=[("name", 1)],
+            projection={"name": 1, "value": 1, "completed": 1, "end_timestamp": 1},
+        )
+        if not await source.count():
+            await ctx.send("This project has no tasks.")
+            return
+
+        async def format_page(entries, start):
+            lines = []
+            for task in entries:
+                done = "\N{WHITE HEAVY CHECK MARK}" if task.get("completed") else "-"
+                due = task["end_timestamp"].strftime("%Y-%m-%d %H:%M UTC")
+                lines.append(
+                    f"{done} `{task['name']}` • `{task['value']}` points • due {due}"
+                )
+            embed = discord.Embed(color=ctx.author.color)
+            embed.set_author(name=f"Tasks in {project}")
+            embed.description = "\n".join(lines)
+            return embed
+
+        try:
+            paginator = await EmbedPages.from_source(
+                ctx.bot, message=ctx.message, source=source, formatter=format_page
+            )
+            await paginator.paginate()
+        except CannotPaginate as e:
+            await ctx.send(str(e))
+
     @commands.Cog.listener()
     async def on_task_member_update(
         self, task: dict, guild_id: int, members: list
     ) -> None:
         """This sends a message when a member is added"""
         projects = ProjectHandler(guild_id)
-        project = projects.find_project(task.get("project"))
-        guild = await self.bot.fetch_guild(guild_id)
+        project = await projects.find_project(task.get("project"))
+        guild = self.bot.get_guild(int(guild_id))
+        guild = guild or await self.bot.fetch_guild(guild_id)
         channel = await self.bot.fetch_channel(int(project.get("channel")))
-        members = [(await guild.fetch_member(member)) for member in members]
+        members = await self.bot.resolver.fetch_members(guild, members)
+        members = list(members.values())
         count = len(members)
+        if count == 0:
+            return
         task_name = task.get("name")
         if count == 1:
             member = members[0]
@@ -190,14 +244,11 @@ class Tasks(commands.Cog, name="Tasks"):
     async def on_task_create(self, guild_id: int, task: dict) -> None:
         """Sends a message on the creation of a task to the project channel."""
         projects = ProjectHandler(guild_id)
-        project = projects.find_project(task.get("project"))
+        project = await projects.find_project(task.get("project"))
         channel = await self.bot.fetch_channel(int(project.get("channel")))
         task_name = task.get("name")
         task_reward = task.get("value")
-        message = await channel.fetch_message(
-            int(projects.find_project(task.get("project")).get("message"))
-        )
-        await message.edit(content=projects.project_progress_bar(task.get("project")))
+        self.progress.touch(guild_id, project.get("name"))
         await channel.send(
             f"**> Task creation:** The task `{task_name}` "
             "was created. Bounty for completion: "
@@ -209,31 +260,19 @@ class Tasks(commands.Cog, name="Tasks"):
         """This event is fired on the completion of a task."""
         pointhandler = Points()
         projects = ProjectHandler(guild_id)
-        project = projects.find_project(task.get("project"))
-        value = (
-            self.bot.db("guilds")
-            .find(guild_id)
-            .get("projects")[project.get("number")]
-            .get("tasks")[task.get("number")]["value"]
-        )
+        project = await projects.find_project(task.get("project"))
+        value = (await projects.find_task(project.get("name"), task.get("name")))[
+            "value"
+        ]
         # start_timestamp = (datetime.datetime.now() -
         #                 task.get("start_timestamp")).total_seconds()
         # end_timestamp = (task.get("end_timestamp") -
         #                datetime.datetime.now()).total_seconds()
-        pointhandler.add_points(guild_id, task, value)
+        await pointhandler.add_points(guild_id, task, value)
 
         channel = await self.bot.fetch_channel(int(project.get("channel")))
         task_name = task.get("name")
-        value = (
-            self.bot.db("guilds")
-            .find(guild_id)
-            .get("projects")[project.get("number")]
-            .get("tasks")[task.get("number")]["value"]
-        )
-        message = await channel.fetch_message(
-            int(projects.find_project(task.get("project")).get("message"))
-        )
-        await message.edit(content=projects.project_progress_bar(task.get("project")))
+        self.progress.touch(guild_id, project.get("name"))
         return await channel.send(
             f"**> Task completion:** The task "
             f"`{task_name}` was completed and "
@@ -246,33 +285,15 @@ class Tasks(commands.Cog, name="Tasks"):
         """This is fired when someone marks a task as incomplete."""
         projects = ProjectHandler(guild_id)
         pointhandler = Points()
-        all_logs = list(self.bot.db("logs").find_all())
-        for member in task.get("assigned"):
-            task_name = task.get("name")
-            logs = list(
-                filter(
-                    lambda all_logs: all_logs["name"]
-                    == f"point_addition_{member}_{task_name}",
-                    all_logs,
-                )
-            )
-            points_gained = [log.get("amount") for log in logs]
-            for points in points_gained:
-                pointhandler.remove_points(guild_id, task, points)
+        await pointhandler.revoke(guild_id, task)
 
-        project = projects.find_project(task.get("project"))
+        project = await projects.find_project(task.get("project"))
         channel = await self.bot.fetch_channel(int(project.get("channel")))
         task_name = task.get("name")
-        task_reward = (
-            self.bot.db("guilds")
-            .find(guild_id)
-            .get("projects")[project.get("number")]
-            .get("tasks")[task.get("number")]["value"]
-        )
-        message = await channel.fetch_message(
-            int(projects.find_project(task.get("project")).get("message"))
-        )
-        await message.edit(content=projects.project_progress_bar(task.get("project")))
+        task_reward = (await projects.find_task(project.get("name"), task_name))[
+            "value"
+        ]
+        self.progress.touch(guild_id, project.get("name"))
         return await channel.send(
             f"**> Task revoked:** The task `{task_name}`"
             " was marked as incomplete. "
@@ -284,49 +305,31 @@ class Tasks(commands.Cog, name="Tasks"):
     async def on_task_due(self, guild_id: int, task: dict):
         """This fires when a task is due."""
         projects = ProjectHandler(guild_id)
-        project = projects.find_project(task.get("project"))
-        completed = (
-            self.bot.db("guilds")
-            .find(str(guild_id))
-            .get("projects")[project.get("number")]
-            .get("tasks")[task.get("number")]
-            .get("completed")
-        )
-        if completed:
+        project = await projects.find_project(task.get("project"))
+        current = await projects.find_task(project.get("name"), task.get("name"))
+        if current.get("completed"):
             return
         channel = await self.bot.fetch_channel(int(project.get("channel")))
-        members = (
-            self.bot.db("guilds")
-            .find(str(guild_id))
-            .get("projects")[project.get("number")]
-            .get("tasks")[task.get("number")]
-            .get("assigned")
-        )
-        members = [(await self.bot.fetch_user(member)) for member in members]
         new_value = task.get("value") * 10 / 100
         if new_value < 1:
             new_value = 1
-        guild = self.bot.db("guilds").find(str(guild_id))
-        guild.get("projects")[project.get("number")].get("tasks")[task.get("number")][
-            "value"
-        ] = new_value
-        self.bot.db("guilds").update(str(guild_id), guild)
-        task = guild.get("projects")[project.get("number")].get("tasks")[
-            task.get("number")
-        ]
+        task = await projects.set_task_value(
+            project.get("name"), task.get("name"), new_value
+        )
+        await projects.flush()
         task_name = task.get("name")
         task_value = task.get("value")
         await channel.send(
             f"**> Task bounty update:** Task `{task_name}` "
             f"is now valued at `{task_value}` points."
         )
-        for member in members:
-            await member.send(
-                f":alarm_clock: The task {task_name}"
-                " is now overdue. And as such, the bounty is "
-                "10% of what it originally was."
-                f" Bounty now: `{task_value}` points."
-            )
+        self.bot.notifier.notify_many(
+            current.get("assigned"),
+            f":alarm_clock: The task {task_name}"
+            " is now overdue. And as such, the bounty is "
+            "10% of what it originally was."
+            f" Bounty now: `{task_value}` points.",
+        )
 
 
 def setup(bot):